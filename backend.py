@@ -1,7 +1,20 @@
+import asyncio
+import math
+import time
+import traceback
 from enum import Enum
 from os import urandom
 from copy import deepcopy
-from libra_address import LibraAddress
+from types import MappingProxyType
+from libra_address import LibraAddress, LibraAddressTemplate, LibraAddressError
+from bech32 import LIBRA_ZERO_SUBADDRESS
+from storage import MemoryStorage
+from subaddress_cipher import SubaddressCipher
+from subaddress_pool import SubaddressPool
+from metrics import LatencyRecorder, timed
+from cache import TTLCache, canonical_digest
+from signing import SigningService
+from expiry import ExpiryHeap
 
 class Status(Enum):
     correct_record = 'correct_record'
@@ -11,12 +24,14 @@ class Status(Enum):
     incorrect_address = 'incorrect_address'
     fresh_dynamic_subaddress = 'fresh_dynamic_subaddress'
     invalid_subaddress = 'invalid_subaddress'
+    invalid_batch_size = 'invalid_batch_size'
     unknown_command = 'unknown_command'
     rejected = 'rejected'
     unexpected_error = 'unexpected_error'
     compliance_signature = 'compliance_signature'
     missing_identifier = 'missing_identifier'
     missing_endpoint = 'missing_endpoint'
+    deadline_exceeded = 'deadline_exceeded'
 
 
 class DynServiceError(Exception):
@@ -25,86 +40,463 @@ class DynServiceError(Exception):
         self.message = message
 
 class ClaimsDB:
-    def __init__(self, own_VASP_address, compliance_key=None, client=None):
+    def __init__(self, own_VASP_address, compliance_key=None, client=None, storage=None, subaddress_key=None,
+                 pool_size=0, pool_low_water=None, pool_refill_batch=None, attest_deadline=30,
+                 signing_service=None, metrics=None, attest_idempotency_window=60,
+                 attest_idempotency_size=4096, subaddress_ttl=None, subaddress_max_uses=None,
+                 attestation_retention=None, expiry_interval=60, clock=time.time, claim_cache_size=4096):
         self.own_VASP_address = LibraAddress.from_encoded_str(own_VASP_address).as_str()
+        self.own_onchain_address = LibraAddress.from_encoded_str(self.own_VASP_address).get_onchain()
+        self.subaddress_template = LibraAddressTemplate.from_encoded_str(self.own_VASP_address)
 
-        self.own_claim_DB = {}
-        self.dyn_DB = {}
-        self.reference_id_DB = {}
-        self.checked_claims_DB = {}
+        # By default all records are kept in memory, see storage.py. The
+        # dyn_DB maps the 8 subaddress bytes of our own subaddresses to the
+        # unique_identifier of a claim in own_claim_DB.
+        self.storage = storage if storage is not None else MemoryStorage()
+        self.own_claim_DB = self.storage.own_claim_DB
+        self.dyn_DB = self.storage.dyn_DB
+        self.reference_id_DB = self.storage.reference_id_DB
+        self.checked_claims_DB = self.storage.checked_claims_DB
+
+        # The flattened (path -> value) form of our own claims, compiled when
+        # they are added or first checked (see compile_claim). Only the
+        # claim_cache_size most recently used are kept in memory.
+        self.compiled_claims = TTLCache(maxsize=claim_cache_size, ttl=math.inf)
+
+        # Read-only views of our own claims, frozen when they are added or
+        # first looked up (see freeze_claim), also bounded to claim_cache_size.
+        self.frozen_claims = TTLCache(maxsize=claim_cache_size, ttl=math.inf)
+
+        # With a subaddress_key, dynamic subaddresses are derived from the
+        # index of the claim and a per-claim counter instead of being stored
+        # in dyn_DB (see subaddress_cipher.py). The claim_index_DB maps claim
+        # indexes to unique_identifiers, and the claim_counter_DB maps
+        # unique_identifiers to their [index, next counter].
+        self.claim_index_DB = self.storage.claim_index_DB
+        self.claim_counter_DB = self.storage.claim_counter_DB
+        self.subaddress_cipher = SubaddressCipher(subaddress_key) if subaddress_key is not None else None
+
+        # Random dynamic subaddresses can be pre-minted in a pool, refilled
+        # in the background (see subaddress_pool.py).
+        self.subaddress_pool = None
+        if pool_size > 0 and self.subaddress_cipher is None:
+            self.subaddress_pool = SubaddressPool(self, pool_size, pool_low_water, pool_refill_batch)
 
         self.compliance_key = compliance_key
         self.client = client
 
+        # Signing runs outside of the event loop, by default on a thread pool
+        # created on first use (see signing.py).
+        self.signing_service = signing_service
+
+        # Deadline (in seconds) of an attestation, and the durations of its steps
+        self.attest_deadline = attest_deadline
+        self.attest_timings = LatencyRecorder()
+
+        # Successful attestations are remembered for attest_idempotency_window
+        # seconds, so that retries get the same reference_id and signature.
+        self.attest_cache = None
+        if attest_idempotency_window > 0:
+            self.attest_cache = TTLCache(
+                maxsize=attest_idempotency_size,
+                ttl=attest_idempotency_window,
+                negative_ttl=0,
+                is_negative=lambda entry: entry[1][0] != Status.compliance_signature,
+            )
+
+        # Latency histograms of the operations, if a MetricsRegistry is set
+        # (see metrics.py).
+        self.metrics = metrics
+
+        # Dynamic subaddresses can expire subaddress_ttl seconds after they
+        # are issued or after subaddress_max_uses lookups, and attestation
+        # records attestation_retention seconds after they are signed. The
+        # dyn_expiry_DB maps subaddress bytes to their [expiry time, uses
+        # left], and the reference_expiry_DB maps the keys of reference_id_DB
+        # to their expiry time. Every expiry_interval seconds, expired records
+        # are purged in order of expiry (see expiry.py).
+        self.subaddress_ttl = subaddress_ttl
+        self.subaddress_max_uses = subaddress_max_uses
+        self.attestation_retention = attestation_retention
+        self.expiry_interval = expiry_interval
+        self.clock = clock
+        self.subaddresses_expire = subaddress_ttl is not None or subaddress_max_uses is not None
+        if self.subaddresses_expire and self.subaddress_cipher is not None:
+            raise ValueError('Derived dynamic subaddresses (with a subaddress_key) cannot expire')
+        self.dyn_expiry_DB = self.storage.dyn_expiry_DB
+        self.reference_expiry_DB = self.storage.reference_expiry_DB
+        self.subaddress_expiries = ExpiryHeap()
+        self.reference_expiries = ExpiryHeap()
+        self._expiry_task = None
+
+    async def start(self):
+        """ Start the background tasks of the ClaimsDB. """
+        if self.subaddress_pool is not None:
+            self.subaddress_pool.start()
+        if self._expiry_task is None and (self.subaddress_ttl is not None or self.attestation_retention is not None):
+            await self.storage.run(self._load_expiries)
+            self._expiry_task = asyncio.get_running_loop().create_task(self._purge_forever())
+
+    async def stop(self):
+        """ Stop the background tasks, close the client and flush the storage
+        of the ClaimsDB. """
+        if self.subaddress_pool is not None:
+            await self.subaddress_pool.stop()
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            try:
+                await self._expiry_task
+            except asyncio.CancelledError:
+                pass
+            self._expiry_task = None
+        if self.client is not None:
+            await self.client.close()
+        if self.signing_service is not None:
+            await self.signing_service.stop()
+        self.storage.flush()
+
     async def call_risk_function(self, originator_claim, beneficiary_claim, amount):
         return True
 
+    @timed('dyn_claims_db_duration_seconds', 'attest')
+    async def attest(self, originator_claim, beneficiary_claim, amount, idempotency_key=None):
+        """ Check both claims and, if they are correct and the risk function
+        accepts the payment, sign a fresh reference_id.
+
+        Returns (Status.compliance_signature, reference_id, signature), or
+        (status, None, None) with the status of the first failed step.
+
+        Within the idempotency window, attesting again for the same claims
+        and amount (or with the same idempotency_key) returns the same
+        reference_id and signature, and concurrent duplicates share a single
+        attestation. Reusing an idempotency_key for other claims or another
+        amount returns Status.unexpected_data.
+        """
+        if self.attest_cache is None:
+            return await self._attest_with_deadline(originator_claim, beneficiary_claim, amount)
+
+        digest = canonical_digest(originator_claim, beneficiary_claim, amount)
+        key = digest if idempotency_key is None else ('idempotency_key', idempotency_key)
+
+        async def compute():
+            return (digest, await self._attest_with_deadline(originator_claim, beneficiary_claim, amount))
+
+        attested_digest, result = await self.attest_cache.get_or_compute(key, compute)
+        if attested_digest != digest:
+            return (Status.unexpected_data, None, None)
+        return result
+
+    async def _attest_with_deadline(self, originator_claim, beneficiary_claim, amount):
+        timings = {}
+        start = time.monotonic()
+        try:
+            return await asyncio.wait_for(
+                self._attest(originator_claim, beneficiary_claim, amount, timings),
+                self.attest_deadline
+            )
+        except asyncio.TimeoutError:
+            return (Status.deadline_exceeded, None, None)
+        finally:
+            timings['total'] = time.monotonic() - start
+            for step, seconds in timings.items():
+                self.attest_timings.record(step, seconds)
+                if self.metrics is not None:
+                    self.metrics.observe('dyn_attest_step_duration_seconds', seconds, step=step)
+
+    async def _attest(self, originator_claim, beneficiary_claim, amount, timings):
+
+        async def _timed_step(step, function, *args):
+            start = time.monotonic()
+            try:
+                return await function(*args)
+            finally:
+                timings[step] = time.monotonic() - start
+
+        # The remote check of the originator claim and the risk function do
+        # not depend on our own claim, so they run while we check it. Other
+        # attests may share the remote check through the cache of the client,
+        # which keeps it running when we cancel our task for it.
+        check_originator = asyncio.ensure_future(
+            _timed_step('check_originator', self.client.check_other_claim, originator_claim))
+        check_risk = asyncio.ensure_future(
+            _timed_step('risk', self.call_risk_function, originator_claim, beneficiary_claim, amount))
+        pending = {check_originator, check_risk}
+
+        try:
+            # Step 1. Check our own claim
+            status = await _timed_step('check_beneficiary', self.check_own_claim, beneficiary_claim)
+            if status != Status.correct_record:
+                return (status, None, None)
+
+            # Steps 2 and 3. Check the originator claim, and with the risk
+            # function whether we want to attest for payment, stopping at
+            # the first failure.
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if check_originator in done and check_originator.result() != Status.correct_record:
+                    return (Status.incorrect_originator_record, None, None)
+                if check_risk in done and check_risk.result() is False:
+                    return (Status.rejected, None, None)
+
+            # Step 4. If all good sign a fresh reference_id and return the result
+            ref_id, signature = await _timed_step(
+                'sign', self.generate_compliance_key_signature, originator_claim, beneficiary_claim, amount)
+            return (Status.compliance_signature, ref_id, signature)
+
+        finally:
+            for task in (check_originator, check_risk):
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Do not warn about exceptions of steps we did not wait for
+                    task.exception()
+
+    @timed('dyn_claims_db_duration_seconds', 'generate_compliance_key_signature')
     async def generate_compliance_key_signature(self, originator_claim, beneficiary_claim, amount):
         # Find a unique_id that is not in use
         reference_id_random_part = urandom(16).hex()
         originator_vasp_address = originator_claim['vasp_libra_address']
         reference_id = f"{originator_vasp_address}_{reference_id_random_part}"
         origin_vasp = LibraAddress.from_encoded_str(originator_vasp_address)
-        signature = self.compliance_key.sign_dual_attestation_data(reference_id, origin_vasp.onchain_address_bytes, amount).hex()
+        if self.signing_service is None:
+            self.signing_service = SigningService(self.compliance_key)
+        signature = (await self.signing_service.sign_dual_attestation_data(
+            reference_id, origin_vasp.onchain_address_bytes, amount)).hex()
 
         # Save signature and bytes to remember travel rule information
-        self.reference_id_DB[(reference_id, signature)] = (originator_claim, beneficiary_claim, amount)
+        await self.storage.run(
+            self._store_attestation,
+            (reference_id, signature),
+            (originator_claim, beneficiary_claim, amount)
+        )
 
         return (reference_id, signature)
 
+    def _store_attestation(self, key, record):
+        self.reference_id_DB[key] = record
+        if self.attestation_retention is not None:
+            expires_at = self.clock() + self.attestation_retention
+            self.reference_expiry_DB[key] = expires_at
+            self.reference_expiries.push(expires_at, key)
+
+    async def purge_expired(self):
+        """ Delete the expired dynamic subaddresses and attestation records,
+        and return how many were deleted. """
+        return await self.storage.run(self._purge_expired, self.clock())
+
+    def _purge_expired(self, now):
+        purged = 0
+        for expires_at, subaddress_bytes in self.subaddress_expiries.pop_expired(now):
+            # Skip the subaddresses deleted after their last use
+            state = self.dyn_expiry_DB.get(subaddress_bytes, None)
+            if state is not None and state[0] == expires_at:
+                self._delete_subaddress(subaddress_bytes)
+                purged += 1
+        for expires_at, key in self.reference_expiries.pop_expired(now):
+            if self.reference_expiry_DB.get(key, None) == expires_at:
+                del self.reference_id_DB[key]
+                del self.reference_expiry_DB[key]
+                purged += 1
+        return purged
+
+    def _load_expiries(self):
+        self.subaddress_expiries = ExpiryHeap(
+            (state[0], subaddress_bytes) for subaddress_bytes, state in self.dyn_expiry_DB.items()
+            if state[0] is not None
+        )
+        self.reference_expiries = ExpiryHeap(
+            (expires_at, key) for key, expires_at in self.reference_expiry_DB.items()
+        )
+
+    async def _purge_forever(self):
+        while True:
+            await asyncio.sleep(self.expiry_interval)
+            try:
+                await self.purge_expired()
+            except Exception:
+                traceback.print_exc()
+
+
+    def own_subaddress_bytes(self, subaddress):
+        """ Return the subaddress bytes of an encoded subaddress of our own
+        VASP address, or None if it is not one. """
+        try:
+            address = LibraAddress.from_encoded_str(subaddress)
+        except LibraAddressError:
+            return None
+        if address.get_onchain() != self.own_onchain_address:
+            return None
+        return address.subaddress_bytes or LIBRA_ZERO_SUBADDRESS
 
+    def _lookup_subaddress(self, subaddress_bytes):
+        """ Return the unique_identifier of the claim a subaddress was issued
+        for, or None. """
+        unique_id = self.dyn_DB.get(subaddress_bytes, None)
+        if unique_id is None and self.subaddress_cipher is not None:
+            unique_id = self._lookup_derived_subaddress(subaddress_bytes)
+        if unique_id is None:
+            return None
+        if self.subaddresses_expire and not self._use_subaddress(subaddress_bytes):
+            return None
+        return unique_id
+
+    def _use_subaddress(self, subaddress_bytes):
+        """ Count a lookup of a stored subaddress, and return False if it has
+        expired. Long term subaddresses never expire. """
+        with self.storage.transaction():
+            state = self.dyn_expiry_DB.get(subaddress_bytes, None)
+            if state is None:
+                # Unless another process has just deleted it
+                return subaddress_bytes in self.dyn_DB
+            expires_at, uses_left = state
+            if expires_at is not None and expires_at <= self.clock():
+                self._delete_subaddress(subaddress_bytes)
+                return False
+            if uses_left is not None:
+                if uses_left <= 1:
+                    self._delete_subaddress(subaddress_bytes)
+                else:
+                    self.dyn_expiry_DB[subaddress_bytes] = [expires_at, uses_left - 1]
+            return True
+
+    def _delete_subaddress(self, subaddress_bytes):
+        self.dyn_DB.pop(subaddress_bytes, None)
+        self.dyn_expiry_DB.pop(subaddress_bytes, None)
+
+    def _insert_subaddresses(self, subaddresses, unique_id):
+        """ Store the subaddresses not in use for a claim, with their expiry,
+        and return them. """
+        with self.storage.transaction():
+            new_subaddresses = _insert_many_new(self.dyn_DB, subaddresses, unique_id)
+            if self.subaddresses_expire:
+                expires_at = self.clock() + self.subaddress_ttl if self.subaddress_ttl is not None else None
+                self.dyn_expiry_DB.update(
+                    (subaddress_bytes, [expires_at, self.subaddress_max_uses])
+                    for subaddress_bytes in new_subaddresses
+                )
+                if expires_at is not None:
+                    for subaddress_bytes in new_subaddresses:
+                        self.subaddress_expiries.push(expires_at, subaddress_bytes)
+            return new_subaddresses
+
+    def _lookup_derived_subaddress(self, subaddress_bytes):
+        decoded = self.subaddress_cipher.decode(subaddress_bytes)
+        if decoded is None:
+            return None
+        claim_index, counter = decoded
+        unique_id = self.claim_index_DB.get(claim_index, None)
+        if unique_id is None:
+            return None
+        # Only accept subaddresses we have issued already
+        _, next_counter = self.claim_counter_DB[unique_id]
+        if counter >= next_counter:
+            return None
+        return unique_id
+
+    def _next_derived_subaddresses(self, unique_id, count):
+        if count < 0:
+            raise ValueError(f'Cannot derive {count} dynamic subaddresses')
+        # Allocate the claim index and counters atomically, as other processes
+        # may share the storage (see workers.py).
+        with self.storage.transaction():
+            state = self.claim_counter_DB.get(unique_id, None)
+            if state is None:
+                claim_index = len(self.claim_index_DB)
+                self.claim_index_DB[claim_index] = unique_id
+                state = [claim_index, 0]
+            claim_index, counter = state
+
+            fresh_subaddresses = []
+            while len(fresh_subaddresses) < count:
+                # Never reissue a subaddress, nothing is stored if this raises
+                if counter >= self.subaddress_cipher.MAX_COUNTER:
+                    raise ValueError(f'Claim {unique_id} has used all its derived dynamic subaddresses')
+                fresh_subaddress = self.subaddress_cipher.encode(claim_index, counter)
+                counter += 1
+                # Skip the (unlikely) values that collide with a stored subaddress
+                if fresh_subaddress not in self.dyn_DB:
+                    fresh_subaddresses.append(fresh_subaddress)
+
+            self.claim_counter_DB[unique_id] = [claim_index, counter]
+            return fresh_subaddresses
+
+    @timed('dyn_claims_db_duration_seconds', 'check_own_dynamic_subaddress')
     async def check_own_dynamic_subaddress(self, dynamic_subaddress):
-        return deepcopy(self.dyn_DB.get(dynamic_subaddress, None))
+        """ Return a read-only view of the claim a subaddress was issued for,
+        or None if it is not one of ours. """
+        subaddress_bytes = self.own_subaddress_bytes(dynamic_subaddress)
+        if subaddress_bytes is None:
+            return None
+        unique_id = await self.storage.run(self._lookup_subaddress, subaddress_bytes)
+        if unique_id is None:
+            return None
+        frozen = self.frozen_claims.get(unique_id)
+        if frozen is None:
+            claim = await self.storage.run(self.own_claim_DB.get, unique_id, None)
+            if claim is None:
+                return None
+            frozen = freeze_claim(claim)
+            self.frozen_claims.put(unique_id, frozen)
+        return frozen
 
 
+    @timed('dyn_claims_db_duration_seconds', 'check_own_claim')
     async def check_own_claim(self, claim):
 
         # First get the claim on record
-        if claim['unique_identifier'] not in self.own_claim_DB:
-            return Status.missing_identifier
+        unique_id = claim['unique_identifier']
+        compiled = self.compiled_claims.get(unique_id)
+        if compiled is None:
+            our_claim = await self.storage.run(self.own_claim_DB.get, unique_id, None)
+            if our_claim is None:
+                return Status.missing_identifier
+            compiled = compile_claim(our_claim)
+            self.compiled_claims.put(unique_id, compiled)
         if 'verification_endpoint' not in claim:
             return Status.incorrect_record
 
         # Checking a claim means that it is a strict subset of the claim we have on record.
-        our_claim = self.own_claim_DB[claim['unique_identifier']]
-        dicts_to_check = [(claim, our_claim)]
-        while dicts_to_check != []:
-            given_struct, own_struct = dicts_to_check.pop()
-            for field in given_struct:
-                if type(given_struct[field]) in {int, str}:
-                    if field not in own_struct:
-                        return Status.unexpected_data
-                    if given_struct[field] != own_struct[field]:
-                        return Status.incorrect_record
-                elif type(given_struct[field]) in {dict}:
-                    if field not in own_struct:
-                        return Status.unexpected_data
-                    dicts_to_check += [(given_struct[field], own_struct[field])]
-                else:
-                    return Status.unexpected_data
-
-        return Status.correct_record
+        return check_compiled_claim(claim, compiled)
 
 
 
     async def generate_dynamic_subaddress(self, beneficiary):
-        # Find a unique_id that is not in use
-        while True:
-            fresh_subaddress = urandom(8)
-            subaddress = LibraAddress.from_encoded_str(self.own_VASP_address)
-            subaddress = LibraAddress.from_bytes(subaddress.onchain_address_bytes, subaddress_bytes = fresh_subaddress, hrp=subaddress.hrp)
-            subaddress_str = subaddress.as_str()
+        status, subaddresses = await self.generate_dynamic_subaddresses(beneficiary, 1)
+        return (status, subaddresses[0])
 
-            if subaddress_str not in self.dyn_DB:
+    @timed('dyn_claims_db_duration_seconds', 'generate_dynamic_subaddresses')
+    async def generate_dynamic_subaddresses(self, beneficiary, count):
+        """ Issue count fresh dynamic subaddresses for a claim, with a single
+        write to the storage. """
+        if count < 0:
+            raise ValueError(f'Cannot generate {count} dynamic subaddresses')
+        unique_id = beneficiary['unique_identifier']
+        if self.subaddress_cipher is not None:
+            fresh_subaddresses = await self.storage.run(self._next_derived_subaddresses, unique_id, count)
+            return (Status.fresh_dynamic_subaddress, self.subaddress_template.encode_many(fresh_subaddresses))
+
+        # Use pre-minted subaddresses if possible, then find subaddresses that are not in use
+        encoded = dict(self.subaddress_pool.take(count)) if self.subaddress_pool is not None else {}
+        candidates = list(encoded) + [urandom(8) for _ in range(count - len(encoded))]
+        fresh_subaddresses = []
+        while True:
+            fresh_subaddresses += await self.storage.run(self._insert_subaddresses, candidates, unique_id)
+            if len(fresh_subaddresses) == count:
                 break
+            candidates = [urandom(8) for _ in range(count - len(fresh_subaddresses))]
 
-        self.dyn_DB[subaddress_str] = deepcopy(beneficiary)
-        return (Status.fresh_dynamic_subaddress, subaddress_str)
+        return (Status.fresh_dynamic_subaddress, [
+            encoded.get(subaddress) or self.subaddress_template.encode(subaddress)
+            for subaddress in fresh_subaddresses
+        ])
 
     def add_own_claim(self, claim):
 
         subaddress = claim['long_term_subaddress']
-        if subaddress in self.dyn_DB:
+        subaddress_bytes = self.own_subaddress_bytes(subaddress)
+        if subaddress_bytes is None:
+            raise Exception(f'Subaddress {subaddress} is not a subaddress of {self.own_VASP_address}!')
+        if subaddress_bytes in self.dyn_DB:
             raise Exception(f'Subaddress {subaddress} already exists!')
 
         # Find a unique_id that is not in use
@@ -118,8 +510,87 @@ class ClaimsDB:
 
         # Store the claim
 
-        self.own_claim_DB[unique_id] = deepcopy(claim)
-        self.dyn_DB[subaddress] = deepcopy(claim)
+        our_claim = deepcopy(claim)
+        self.own_claim_DB[unique_id] = our_claim
+        self.dyn_DB[subaddress_bytes] = unique_id
+        self.compiled_claims.put(unique_id, compile_claim(our_claim))
+        self.frozen_claims.put(unique_id, freeze_claim(our_claim))
 
         # Return the claim
         return claim
+
+
+class _Nested:
+    """ The value of a nested dict in a compiled claim. """
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+
+_MISSING = object()
+
+
+def compile_claim(claim):
+    """ Flatten a (nested) claim into a dict from (node, field) pairs to
+    values, where the node numbers the dict that holds the field (0 for the
+    claim itself), and nested dicts are replaced by a _Nested node. """
+    compiled = {}
+    dicts_to_compile = [(0, claim)]
+    nodes = 1
+    while dicts_to_compile:
+        node, struct = dicts_to_compile.pop()
+        for field, value in struct.items():
+            if isinstance(value, dict):
+                compiled[node, field] = _Nested(nodes)
+                dicts_to_compile.append((nodes, value))
+                nodes += 1
+            else:
+                compiled[node, field] = value
+    return compiled
+
+
+def check_compiled_claim(claim, compiled):
+    """ Check that a claim is a subset of a compiled claim, with one lookup
+    per field of the claim. Fields are checked in the order of a depth first
+    walk of the claim: all the fields of a dict, then its nested dicts, the
+    last one first. """
+    dicts_to_check = [(0, claim)]
+    while dicts_to_check:
+        node, given_struct = dicts_to_check.pop()
+        for field, value in given_struct.items():
+            kind = type(value)
+            if kind is str or kind is int:
+                own_value = compiled.get((node, field), _MISSING)
+                if own_value is _MISSING:
+                    return Status.unexpected_data
+                if value != own_value:
+                    return Status.incorrect_record
+            elif kind is dict:
+                own_value = compiled.get((node, field), _MISSING)
+                if own_value is _MISSING:
+                    return Status.unexpected_data
+                if type(own_value) is not _Nested:
+                    return Status.incorrect_record
+                dicts_to_check.append((own_value.node, value))
+            else:
+                return Status.unexpected_data
+
+    return Status.correct_record
+
+
+def freeze_claim(value):
+    """ Return a read-only copy of a (nested) claim, where dicts become
+    read-only views and lists become tuples. """
+    if isinstance(value, dict):
+        return MappingProxyType({field: freeze_claim(item) for field, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_claim(item) for item in value)
+    return value
+
+
+def _insert_many_new(table, keys, value):
+    """ Store value under each of the keys that is not in use, returns the keys stored. """
+    new_keys = [key for key in dict.fromkeys(keys) if key not in table]
+    table.update((key, value) for key in new_keys)
+    return new_keys
@@ -10,8 +10,12 @@
 
 """Reference implementation for Bech32 encoding of Libra Blockchain addresses and sub-addresses."""
 
-from typing import Iterable, List, Optional, Tuple
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, batch functions fall back to the scalar path
+    np = None
 
 LBR = "lbr"  # lbr for mainnet
 TLB = "tlb"  # tlb for testnet
@@ -20,6 +24,7 @@ TLB = "tlb"  # tlb for testnet
 __BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
 __BECH32_SEPARATOR = "1"
 __BECH32_CHECKSUM_CHAR_SIZE = 6
+__BECH32_GENERATOR = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
 
 # LIBRA constants
 __LIBRA_HRP = [LBR, TLB]
@@ -27,6 +32,7 @@ __LIBRA_ADDRESS_SIZE = 16  # in bytes
 __LIBRA_SUBADDRESS_SIZE = 8  # in bytes (for V1)
 __LIBRA_BECH32_VERSION = 1
 __LIBRA_BECH32_SIZE = 50  # in characters
+__LIBRA_DATA_SYMBOLS = 39  # 5-bit symbols carrying the address and subaddress bytes
 
 LIBRA_ZERO_SUBADDRESS = b"\0" * __LIBRA_SUBADDRESS_SIZE
 
@@ -41,27 +47,7 @@ def bech32_address_encode(
     hrp: str, address_bytes: bytes, subaddress_bytes: Optional[bytes]
 ) -> str:
     """Encode a Libra address (and sub-address if provided)."""
-    # check correct hrp
-    if hrp not in __LIBRA_HRP:
-        raise Bech32Error(
-            f"Wrong Libra address Bech32 human readable part (prefix): expected "
-            f"{__LIBRA_HRP[0]} for mainnet or {__LIBRA_HRP[1]} for testnet, but {hrp} was provided"
-        )
-
-    # only accept correct size for Libra address
-    if len(address_bytes) != __LIBRA_ADDRESS_SIZE:
-        raise Bech32Error(
-            f"Address size should be {__LIBRA_ADDRESS_SIZE}, but got: {len(address_bytes)}"
-        )
-
-    # only accept correct size for Libra subaddress (if set)
-    if (
-        subaddress_bytes is not None
-        and len(subaddress_bytes) != __LIBRA_SUBADDRESS_SIZE
-    ):
-        raise Bech32Error(
-            f"Subaddress size should be {__LIBRA_SUBADDRESS_SIZE}, but got: {len(subaddress_bytes)}"
-        )
+    __check_encode_input(hrp, address_bytes, subaddress_bytes)
 
     encoding_version = __LIBRA_BECH32_VERSION
 
@@ -71,11 +57,14 @@ def bech32_address_encode(
     )
     total_bytes = address_bytes + subaddress_final_bytes
 
-    five_bit_data = __convertbits(total_bytes, 8, 5, True)
-    # check base conversion
-    if five_bit_data is None:
-        raise Bech32Error("Error converting bytes to base32")
-    return __bech32_encode(hrp, [encoding_version] + five_bit_data)
+    five_bit_data = __libra_bytes_to_symbols(total_bytes)
+    checksum = __libra_create_checksum(hrp, five_bit_data)
+    return (
+        hrp
+        + __BECH32_SEPARATOR
+        + __BECH32_CHARSET[encoding_version]
+        + "".join([__BECH32_CHARSET[d] for d in five_bit_data + checksum])
+    )
 
 
 def bech32_address_decode(bech32: str, expected_hrp: Optional[str] = None) -> Tuple[str, int, bytes, bytes]:
@@ -111,12 +100,12 @@ def bech32_address_decode(bech32: str, expected_hrp: Optional[str] = None) -> Tu
         raise Bech32Error(f"Non-expected Bech32 separator: {bech32[3]}")
 
     # check characters after separator in Bech32 alphabet
-    if not all(x in __BECH32_CHARSET for x in bech32[4:]):
+    symbols = [__BECH32_CHARSET_INDEX.get(x) for x in bech32[4:]]
+    if None in symbols:
         raise Bech32Error(f"Invalid Bech32 characters detected: {bech32}")
-    hrp = bech32[:3]
 
     # version is defined by the index of the Bech32 character after separator
-    address_version = __BECH32_CHARSET.find(bech32[4])
+    address_version = symbols[0]
     # check valid version
     if address_version != __LIBRA_BECH32_VERSION:
         raise Bech32Error(
@@ -124,15 +113,13 @@ def bech32_address_decode(bech32: str, expected_hrp: Optional[str] = None) -> Tu
             f"but received {address_version}"
         )
 
-    # we've already checked that all characters are in the correct alphabet,
-    # thus, this will always succeed
-    data = [__BECH32_CHARSET.find(x) for x in bech32[5:]]
+    data = symbols[1:]
 
     # check Bech32 checksum
-    if not __bech32_verify_checksum(hrp, [address_version] + data):
+    if not __libra_verify_checksum(hrp, data):
         raise Bech32Error(f"Bech32 checksum validation failed: {bech32}")
 
-    decoded_data = __convertbits(data[:-__BECH32_CHECKSUM_CHAR_SIZE], 5, 8, False)
+    decoded_data = __libra_symbols_to_bytes(data[:-__BECH32_CHECKSUM_CHAR_SIZE])
     # check base conversion
     if decoded_data is None:
         raise Bech32Error("Error converting bytes from base32")
@@ -147,69 +134,385 @@ def bech32_address_decode(bech32: str, expected_hrp: Optional[str] = None) -> Tu
     return (
         hrp,
         address_version,
-        bytes(decoded_data[:__LIBRA_ADDRESS_SIZE]),
-        bytes(decoded_data[-__LIBRA_SUBADDRESS_SIZE:]),
+        decoded_data[:__LIBRA_ADDRESS_SIZE],
+        decoded_data[-__LIBRA_SUBADDRESS_SIZE:],
     )
 
 
-def __bech32_polymod(values: Iterable[int]) -> int:
-    """Internal function that computes the Bech32 checksum."""
-    generator = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
-    chk = 1
+def __check_encode_input(
+    hrp: str, address_bytes: bytes, subaddress_bytes: Optional[bytes]
+) -> None:
+    """Raise a Bech32Error if the inputs of an encoding are not valid."""
+    # check correct hrp
+    if hrp not in __LIBRA_HRP:
+        raise Bech32Error(
+            f"Wrong Libra address Bech32 human readable part (prefix): expected "
+            f"{__LIBRA_HRP[0]} for mainnet or {__LIBRA_HRP[1]} for testnet, but {hrp} was provided"
+        )
+
+    # only accept correct size for Libra address
+    if len(address_bytes) != __LIBRA_ADDRESS_SIZE:
+        raise Bech32Error(
+            f"Address size should be {__LIBRA_ADDRESS_SIZE}, but got: {len(address_bytes)}"
+        )
+
+    # only accept correct size for Libra subaddress (if set)
+    if (
+        subaddress_bytes is not None
+        and len(subaddress_bytes) != __LIBRA_SUBADDRESS_SIZE
+    ):
+        raise Bech32Error(
+            f"Subaddress size should be {__LIBRA_SUBADDRESS_SIZE}, but got: {len(subaddress_bytes)}"
+        )
+
+
+def __bech32_polymod(values: Iterable[int], chk: int = 1) -> int:
+    """Internal function that computes the Bech32 checksum.
+
+    The generator contributions of the 5 bits shifted out at every step are
+    looked up in a table, so each input symbol costs a single step. An
+    intermediate state can be passed in as `chk` to continue a computation.
+    """
+    table = __BECH32_POLYMOD_TABLE
     for value in values:
-        top = chk >> 25
-        chk = (chk & 0x1FFFFFF) << 5 ^ value
-        for i in range(5):
-            chk ^= generator[i] if ((top >> i) & 1) else 0
+        chk = ((chk & 0x1FFFFFF) << 5) ^ value ^ table[chk >> 25]
     return chk
 
 
+def __bech32_polymod_table() -> List[int]:
+    """Pre-compute the generator XOR for each possible 5-bit top value."""
+    table = []
+    for top in range(32):
+        entry = 0
+        for i in range(5):
+            entry ^= __BECH32_GENERATOR[i] if ((top >> i) & 1) else 0
+        table.append(entry)
+    return table
+
+
 def __bech32_hrp_expand(hrp: str) -> List[int]:
     """Expand the HRP into values for checksum computation."""
-    # TODO We could pre-compute expanded Libra's HRP.
-    # __LIBRA_MAINNET_HRP_EXPANDED = [3, 3, 3, 0, 12, 2, 18]
-    # __LIBRA_TESTNET_HRP_EXPANDED = [3, 3, 3, 0, 20, 12, 2]
     return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
 
 
-def __bech32_verify_checksum(hrp: str, data: Iterable[int]) -> bool:
-    """Verify a checksum given HRP and converted data characters."""
-    return __bech32_polymod(__bech32_hrp_expand(hrp) + list(data)) == 1
+def __libra_verify_checksum(hrp: str, data: List[int]) -> bool:
+    """Verify the checksum of a Libra address given its HRP and the data
+    characters following the version."""
+    return __bech32_polymod(data, __LIBRA_PREFIX_STATE[hrp]) == 1
 
 
-def __bech32_create_checksum(hrp: str, data: Iterable[int]) -> List[int]:
-    """Compute the checksum values given HRP and data."""
-    values = __bech32_hrp_expand(hrp) + list(data)
-    polymod = __bech32_polymod(values + [0, 0, 0, 0, 0, 0]) ^ 1
+def __libra_create_checksum(hrp: str, data: List[int]) -> List[int]:
+    """Compute the checksum values of a Libra address given its HRP and the
+    data characters following the version."""
+    polymod = __bech32_polymod(data + [0, 0, 0, 0, 0, 0], __LIBRA_PREFIX_STATE[hrp]) ^ 1
     return [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
 
 
-def __bech32_encode(hrp: str, data: Iterable[int]) -> str:
-    """Compute a Bech32 string given HRP and data values."""
-    combined = list(data) + __bech32_create_checksum(hrp, data)
-    return hrp + __BECH32_SEPARATOR + "".join([__BECH32_CHARSET[d] for d in combined])
+def __libra_bytes_to_symbols(data: bytes) -> List[int]:
+    """Convert the 24 address and sub-address bytes to 39 5-bit symbols,
+    padding the last symbol with zero bits."""
+    acc = int.from_bytes(data, "big") << __LIBRA_PADDING_BITS
+    return [(acc >> shift) & 31 for shift in __LIBRA_SYMBOL_SHIFTS]
 
 
-def __convertbits(
-    data: Iterable[int], from_bits: int, to_bits: int, pad: bool
-) -> Optional[List[int]]:
-    """General power-of-2 base conversion."""
+def __libra_symbols_to_bytes(data: List[int]) -> Optional[bytes]:
+    """Convert 39 5-bit symbols back to 24 bytes, or None if the padding
+    bits are not zero."""
     acc = 0
-    bits = 0
-    ret = []
-    maxv = (1 << to_bits) - 1
-    max_acc = (1 << (from_bits + to_bits - 1)) - 1
     for value in data:
-        if value < 0 or (value >> from_bits):
-            return None
-        acc = ((acc << from_bits) | value) & max_acc
-        bits += from_bits
-        while bits >= to_bits:
-            bits -= to_bits
-            ret.append((acc >> bits) & maxv)
-    if pad:
-        if bits:
-            ret.append((acc << (to_bits - bits)) & maxv)
-    elif bits >= from_bits or ((acc << (to_bits - bits)) & maxv):
+        acc = (acc << 5) | value
+    if acc & ((1 << __LIBRA_PADDING_BITS) - 1):
         return None
-    return ret
+    return (acc >> __LIBRA_PADDING_BITS).to_bytes(
+        __LIBRA_ADDRESS_SIZE + __LIBRA_SUBADDRESS_SIZE, "big"
+    )
+
+
+__BECH32_CHARSET_INDEX = {x: i for i, x in enumerate(__BECH32_CHARSET)}
+__BECH32_POLYMOD_TABLE = __bech32_polymod_table()
+
+# A Libra address is always 50 characters: 3 for the HRP, the separator, the
+# version, 39 data symbols and the 6 checksum symbols. The checksum state after
+# the HRP and version only depends on the network, so it is computed once.
+__LIBRA_PADDING_BITS = 5 * __LIBRA_DATA_SYMBOLS - 8 * (__LIBRA_ADDRESS_SIZE + __LIBRA_SUBADDRESS_SIZE)
+__LIBRA_SYMBOL_SHIFTS = [5 * i for i in reversed(range(__LIBRA_DATA_SYMBOLS))]
+__LIBRA_PREFIX_STATE = {
+    hrp: __bech32_polymod(__bech32_hrp_expand(hrp) + [__LIBRA_BECH32_VERSION])
+    for hrp in __LIBRA_HRP
+}
+
+
+# Address templates
+#
+# A VASP derives many sub-addresses from the same on-chain address. The first
+# 25 data symbols of the encoding only depend on the (first 125 bits of the)
+# on-chain address, so a template keeps their characters and the checksum
+# state after them, and encoding a sub-address only processes the remaining
+# 14 symbols and the checksum.
+
+__LIBRA_TEMPLATE_SYMBOLS = (8 * __LIBRA_ADDRESS_SIZE) // 5
+__LIBRA_TEMPLATE_CARRY_BITS = 8 * __LIBRA_ADDRESS_SIZE - 5 * __LIBRA_TEMPLATE_SYMBOLS
+__LIBRA_SUFFIX_SHIFTS = __LIBRA_SYMBOL_SHIFTS[__LIBRA_TEMPLATE_SYMBOLS:]
+
+
+class Bech32AddressTemplate(NamedTuple):
+    """Pre-computed encoding state for one HRP and on-chain address."""
+
+    hrp: str
+    address_bytes: bytes
+    prefix: str  # HRP, separator, version and the first data characters
+    state: int  # checksum state after the prefix
+    carry: int  # last bits of the on-chain address, not yet encoded
+
+
+def bech32_address_template(hrp: str, address_bytes: bytes) -> Bech32AddressTemplate:
+    """Pre-compute the encoding of a Libra address, for later use with
+    `bech32_template_encode` on many sub-addresses."""
+    __check_encode_input(hrp, address_bytes, None)
+
+    acc = int.from_bytes(address_bytes, "big")
+    head = acc >> __LIBRA_TEMPLATE_CARRY_BITS
+    symbols = [(head >> shift) & 31 for shift in reversed(range(0, 5 * __LIBRA_TEMPLATE_SYMBOLS, 5))]
+    prefix = (
+        hrp
+        + __BECH32_SEPARATOR
+        + __BECH32_CHARSET[__LIBRA_BECH32_VERSION]
+        + "".join([__BECH32_CHARSET[d] for d in symbols])
+    )
+    state = __bech32_polymod(symbols, __LIBRA_PREFIX_STATE[hrp])
+    carry = acc & ((1 << __LIBRA_TEMPLATE_CARRY_BITS) - 1)
+    return Bech32AddressTemplate(hrp, address_bytes, prefix, state, carry)
+
+
+def bech32_template_encode(
+    template: Bech32AddressTemplate, subaddress_bytes: Optional[bytes]
+) -> str:
+    """Encode the address of a template with the given sub-address. The result
+    is the same as `bech32_address_encode(template.hrp, template.address_bytes, subaddress_bytes)`."""
+    if subaddress_bytes is None:
+        subaddress_bytes = LIBRA_ZERO_SUBADDRESS
+    elif len(subaddress_bytes) != __LIBRA_SUBADDRESS_SIZE:
+        raise Bech32Error(
+            f"Subaddress size should be {__LIBRA_SUBADDRESS_SIZE}, but got: {len(subaddress_bytes)}"
+        )
+
+    acc = (
+        (template.carry << (8 * __LIBRA_SUBADDRESS_SIZE)) | int.from_bytes(subaddress_bytes, "big")
+    ) << __LIBRA_PADDING_BITS
+    symbols = [(acc >> shift) & 31 for shift in __LIBRA_SUFFIX_SHIFTS]
+    polymod = __bech32_polymod(symbols + [0, 0, 0, 0, 0, 0], template.state) ^ 1
+    symbols += [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return template.prefix + "".join([__BECH32_CHARSET[d] for d in symbols])
+
+
+def bech32_template_encode_many(
+    template: Bech32AddressTemplate, subaddresses: Iterable[Optional[bytes]]
+) -> List[str]:
+    """Encode the address of a template with each of the given sub-addresses."""
+    return [bech32_template_encode(template, subaddress_bytes) for subaddress_bytes in subaddresses]
+
+
+# Batch encoding and decoding
+#
+# The batch functions below process many addresses at once. When numpy is
+# available the base conversion and the checksum run column by column over
+# whole arrays of addresses; otherwise (or for any item that does not pass the
+# vectorized validation) the scalar functions above are used, so that results
+# and errors are always identical to calling them one item at a time.
+
+def __check_encode_item(item) -> Tuple[bytes, Optional[bytes]]:
+    """Return the (address, sub-address) of a batch item, or raise a Bech32Error."""
+    try:
+        address_bytes, subaddress_bytes = item
+    except (TypeError, ValueError):
+        raise Bech32Error(f"Expected an (address, sub-address) pair, but got: {item!r}")
+    if not isinstance(address_bytes, (bytes, bytearray)):
+        raise Bech32Error(f"Address should be bytes, but got: {type(address_bytes).__name__}")
+    if subaddress_bytes is not None and not isinstance(subaddress_bytes, (bytes, bytearray)):
+        raise Bech32Error(f"Subaddress should be bytes, but got: {type(subaddress_bytes).__name__}")
+    return address_bytes, subaddress_bytes
+
+
+def bech32_address_encode_batch(
+    hrp: str, addresses: Iterable[Tuple[bytes, Optional[bytes]]]
+) -> Tuple[List[Optional[str]], List[Optional[Bech32Error]]]:
+    """Encode many (address, sub-address) pairs with the same HRP.
+
+    Returns two lists of the same length as the input: the encoded strings
+    (None where encoding failed) and the errors (None where it succeeded).
+    """
+    pairs = list(addresses)
+    results: List[Optional[str]] = [None] * len(pairs)
+    errors: List[Optional[Bech32Error]] = [None] * len(pairs)
+
+    fast_rows = []
+    fast_index = []
+    for i, pair in enumerate(pairs):
+        try:
+            address_bytes, subaddress_bytes = __check_encode_item(pair)
+        except Bech32Error as e:
+            errors[i] = e
+            continue
+        if subaddress_bytes is None:
+            subaddress_bytes = LIBRA_ZERO_SUBADDRESS
+        if (
+            np is not None
+            and hrp in __LIBRA_HRP
+            and type(address_bytes) is bytes
+            and type(subaddress_bytes) is bytes
+            and len(address_bytes) == __LIBRA_ADDRESS_SIZE
+            and len(subaddress_bytes) == __LIBRA_SUBADDRESS_SIZE
+        ):
+            fast_rows.append(address_bytes + subaddress_bytes)
+            fast_index.append(i)
+        else:
+            try:
+                results[i] = bech32_address_encode(hrp, address_bytes, subaddress_bytes)
+            except Bech32Error as e:
+                errors[i] = e
+
+    if fast_rows:
+        for i, encoded in zip(fast_index, __np_encode(hrp, fast_rows)):
+            results[i] = encoded
+    return results, errors
+
+
+def bech32_address_decode_batch(
+    bech32s: Iterable[str], expected_hrp: Optional[str] = None
+) -> Tuple[List[Optional[Tuple[str, int, bytes, bytes]]], List[Optional[Bech32Error]]]:
+    """Validate and decode many Bech32 Libra addresses.
+
+    Returns two lists of the same length as the input: the decoded
+    (hrp, version, address, sub-address) tuples (None where decoding failed)
+    and the errors (None where it succeeded).
+    """
+    strings = list(bech32s)
+    results: List[Optional[Tuple[str, int, bytes, bytes]]] = [None] * len(strings)
+    errors: List[Optional[Bech32Error]] = [None] * len(strings)
+
+    fast_rows = []
+    fast_index = []
+    slow_index = []
+    for i, bech32 in enumerate(strings):
+        if (
+            np is not None
+            and type(bech32) is str
+            and len(bech32) == __LIBRA_BECH32_SIZE
+            and bech32.isascii()
+            and (bech32 == bech32.lower() or bech32 == bech32.upper())
+        ):
+            fast_rows.append(bech32.lower())
+            fast_index.append(i)
+        else:
+            slow_index.append(i)
+
+    if fast_rows:
+        decoded = __np_decode(fast_rows, expected_hrp)
+        for i, item in zip(fast_index, decoded):
+            if item is None:
+                slow_index.append(i)
+            else:
+                results[i] = item
+
+    # The scalar decoder reports the exact error for anything the
+    # vectorized path rejected.
+    for i in slow_index:
+        try:
+            results[i] = bech32_address_decode(strings[i], expected_hrp)
+        except Bech32Error as e:
+            errors[i] = e
+    return results, errors
+
+
+def __np_bech32_polymod(chk: "np.ndarray", values: "np.ndarray") -> "np.ndarray":
+    """Compute the Bech32 checksum state of many rows of 5-bit values at once."""
+    table = np.array(__BECH32_POLYMOD_TABLE, dtype=np.uint32)
+    chk = chk.astype(np.uint32)
+    for column in values.T.astype(np.uint32):
+        chk = ((chk & 0x1FFFFFF) << 5) ^ column ^ table[chk >> 25]
+    return chk
+
+
+def __np_prefix_state(hrp: str, n: int) -> "np.ndarray":
+    """Checksum state after the HRP and version, repeated for n rows."""
+    return np.full(n, __LIBRA_PREFIX_STATE[hrp], dtype=np.uint32)
+
+
+def __np_encode(hrp: str, rows: List[bytes]) -> List[str]:
+    """Encode rows of 24 address and sub-address bytes into Bech32 strings."""
+    n = len(rows)
+    raw = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(n, -1)
+
+    # 8 to 5 bit conversion, padding 192 bits to 195
+    bits = np.unpackbits(raw, axis=1)
+    bits = np.concatenate([bits, np.zeros((n, 3), dtype=np.uint8)], axis=1)
+    weights = np.array([16, 8, 4, 2, 1], dtype=np.uint8)
+    five_bit_data = (bits.reshape(n, __LIBRA_DATA_SYMBOLS, 5) * weights).sum(axis=2, dtype=np.uint8)
+
+    data = np.concatenate(
+        [np.full((n, 1), __LIBRA_BECH32_VERSION, dtype=np.uint8), five_bit_data], axis=1
+    )
+    padded = np.concatenate(
+        [five_bit_data, np.zeros((n, __BECH32_CHECKSUM_CHAR_SIZE), dtype=np.uint8)], axis=1
+    )
+    polymod = __np_bech32_polymod(__np_prefix_state(hrp, n), padded) ^ np.uint32(1)
+    shifts = np.array([5 * (5 - i) for i in range(__BECH32_CHECKSUM_CHAR_SIZE)], dtype=np.uint32)
+    checksum = ((polymod[:, None] >> shifts) & 31).astype(np.uint8)
+
+    charset = np.frombuffer(__BECH32_CHARSET.encode("ascii"), dtype=np.uint8)
+    symbols = charset[np.concatenate([data, checksum], axis=1)]
+    width = symbols.shape[1]
+    text = symbols.tobytes().decode("ascii")
+    prefix = hrp + __BECH32_SEPARATOR
+    return [prefix + text[i * width:(i + 1) * width] for i in range(n)]
+
+
+def __np_decode(
+    rows: List[str], expected_hrp: Optional[str]
+) -> List[Optional[Tuple[str, int, bytes, bytes]]]:
+    """Decode lower case, 50 character ASCII strings. Rows that fail any
+    check are returned as None."""
+    n = len(rows)
+    raw = np.frombuffer("".join(rows).encode("ascii"), dtype=np.uint8).reshape(n, -1)
+
+    hrps = raw[:, :3]
+    is_lbr = (hrps == np.frombuffer(LBR.encode("ascii"), dtype=np.uint8)).all(axis=1)
+    is_tlb = (hrps == np.frombuffer(TLB.encode("ascii"), dtype=np.uint8)).all(axis=1)
+    valid = is_lbr | is_tlb
+    if expected_hrp:
+        valid &= is_lbr if expected_hrp == LBR else is_tlb if expected_hrp == TLB else False
+    valid &= raw[:, 3] == ord(__BECH32_SEPARATOR)
+
+    reverse_charset = np.full(256, -1, dtype=np.int16)
+    reverse_charset[np.frombuffer(__BECH32_CHARSET.encode("ascii"), dtype=np.uint8)] = np.arange(32)
+    values = reverse_charset[raw[:, 4:]]
+    valid &= (values >= 0).all(axis=1)
+    values = np.where(values >= 0, values, 0).astype(np.uint8)
+    valid &= values[:, 0] == __LIBRA_BECH32_VERSION
+
+    state = np.where(is_lbr, __np_prefix_state(LBR, n), __np_prefix_state(TLB, n))
+    valid &= __np_bech32_polymod(state, values[:, 1:]) == 1
+
+    # 5 to 8 bit conversion, the 3 padding bits must be zero
+    data = values[:, 1:1 + __LIBRA_DATA_SYMBOLS]
+    bits = ((data[:, :, None] >> np.array([4, 3, 2, 1, 0], dtype=np.uint8)) & 1).reshape(n, -1)
+    total_bits = 8 * (__LIBRA_ADDRESS_SIZE + __LIBRA_SUBADDRESS_SIZE)
+    valid &= ~bits[:, total_bits:].any(axis=1)
+    decoded = np.packbits(bits[:, :total_bits], axis=1).tobytes()
+
+    results: List[Optional[Tuple[str, int, bytes, bytes]]] = []
+    width = __LIBRA_ADDRESS_SIZE + __LIBRA_SUBADDRESS_SIZE
+    for i in range(n):
+        if not valid[i]:
+            results.append(None)
+            continue
+        row = decoded[i * width:(i + 1) * width]
+        results.append(
+            (
+                rows[i][:3],
+                __LIBRA_BECH32_VERSION,
+                row[:__LIBRA_ADDRESS_SIZE],
+                row[__LIBRA_ADDRESS_SIZE:],
+            )
+        )
+    return results
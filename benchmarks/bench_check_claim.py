@@ -0,0 +1,66 @@
+""" Time per ClaimsDB.check_own_claim on deep and wide claims.
+
+Compares the previous check (a walk of the submitted and the stored claims
+together) with the current one (one lookup per submitted field in the
+compiled stored claim). The storage lookup and the event loop are left out.
+
+    python benchmarks/bench_check_claim.py [number_of_checks]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import ClaimsDB, Status, check_compiled_claim
+from example_claims import example_claim
+from libra_address import LibraAddress
+
+
+def previous_check_own_claim(claim, our_claim):
+    """ The check of a claim against the claim on record before claims were compiled. """
+    dicts_to_check = [(claim, our_claim)]
+    while dicts_to_check != []:
+        given_struct, own_struct = dicts_to_check.pop()
+        for field in given_struct:
+            if type(given_struct[field]) in {int, str}:
+                if field not in own_struct:
+                    return Status.unexpected_data
+                if given_struct[field] != own_struct[field]:
+                    return Status.incorrect_record
+            elif type(given_struct[field]) in {dict}:
+                if field not in own_struct:
+                    return Status.unexpected_data
+                dicts_to_check += [(given_struct[field], own_struct[field])]
+            else:
+                return Status.unexpected_data
+    return Status.correct_record
+
+
+def per_call(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main(count):
+    vasp_bytes = os.urandom(16)
+    cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str())
+
+    print(f'checks: {count}')
+    for shape in ('beneficiary', 'wide', 'deep'):
+        claim = cdb.add_own_claim(example_claim(vasp_bytes, shape=shape))
+        our_claim = cdb.own_claim_DB[claim['unique_identifier']]
+        compiled = cdb.compiled_claims.get(claim['unique_identifier'])
+        assert previous_check_own_claim(claim, our_claim) == Status.correct_record
+        assert check_compiled_claim(claim, compiled) == Status.correct_record
+
+        before = per_call(lambda: previous_check_own_claim(claim, our_claim), count)
+        after = per_call(lambda: check_compiled_claim(claim, compiled), count)
+        print(f'{shape:11} before: {before:8.1f} us   after: {after:8.1f} us')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
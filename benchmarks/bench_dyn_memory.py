@@ -0,0 +1,65 @@
+""" Memory used per dynamic subaddress by ClaimsDB.
+
+Compares the previous layout of dyn_DB (encoded subaddress -> deep copy of
+the claim) with the current one (subaddress bytes -> claim unique_identifier).
+
+    python benchmarks/bench_dyn_memory.py [number_of_subaddresses]
+"""
+
+import asyncio
+import os
+import sys
+import tracemalloc
+from copy import deepcopy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import ClaimsDB
+from example_claims import example_claim
+from libra_address import LibraAddress
+
+
+def measure(function):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = function()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def deep_copy_layout(claim, subaddresses):
+    """ The dyn_DB layout before claims were normalized. """
+    template = LibraAddress.from_encoded_str(claim['vasp_libra_address'])
+    dyn_DB = {}
+    for subaddress_bytes in subaddresses:
+        encoded = LibraAddress.from_bytes(template.onchain_address_bytes, subaddress_bytes).as_str()
+        dyn_DB[encoded] = deepcopy(claim)
+    return dyn_DB
+
+
+def normalized_layout(cdb, claim, count):
+    async def mint():
+        for _ in range(count):
+            await cdb.generate_dynamic_subaddress(claim)
+    asyncio.run(mint())
+    return cdb
+
+
+def main(count):
+    vasp_bytes = os.urandom(16)
+    cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str())
+    claim = cdb.add_own_claim(example_claim(vasp_bytes))
+    subaddresses = [os.urandom(8) for _ in range(count)]
+
+    before = measure(lambda: deep_copy_layout(claim, subaddresses))
+    after = measure(lambda: normalized_layout(cdb, claim, count))
+
+    print(f'subaddresses:                {count}')
+    print(f'bytes per subaddress before: {before / count:.0f}')
+    print(f'bytes per subaddress after:  {after / count:.0f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
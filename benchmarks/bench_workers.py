@@ -0,0 +1,91 @@
+""" Throughput of /check with 1, 2, 4, ... worker processes (see workers.py).
+
+Each run starts a WorkerPool on a shared SQLite file, then client processes
+send /check requests with a fixed concurrency for a fixed duration. Clients
+and workers run on the same machine, so the scaling flattens out once
+workers and clients together use all the cores.
+
+    python benchmarks/bench_workers.py [duration_seconds] [max_workers]
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from example_claims import example_claim
+from libra_address import LibraAddress
+from workers import WorkerPool, shared_claims_db
+
+PORT = 8190
+CLIENT_PROCESSES = 2
+CONCURRENCY = 32
+
+
+async def drive(claims, duration):
+    url = f'http://localhost:{PORT}/check'
+    deadline = time.monotonic() + duration
+    done = 0
+
+    async def worker(session, offset):
+        nonlocal done
+        i = offset
+        while time.monotonic() < deadline:
+            async with session.post(url, json=claims[i % len(claims)]) as resp:
+                await resp.read()
+            done += 1
+            i += CONCURRENCY
+
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[worker(session, offset) for offset in range(CONCURRENCY)])
+    return done
+
+
+def client_main(claims, duration):
+    return asyncio.run(drive(claims, duration))
+
+
+def run(workers, path, vasp_address, claims, duration):
+    pool = WorkerPool(functools.partial(shared_claims_db, vasp_address, path),
+                      address='localhost', port=PORT, workers=workers, log_sample_rate=0)
+    pool.start()
+    try:
+        assert pool.wait_ready(), 'workers failed to start'
+        with multiprocessing.Pool(CLIENT_PROCESSES) as clients:
+            start = time.monotonic()
+            counts = clients.starmap(client_main, [(claims, duration)] * CLIENT_PROCESSES)
+            elapsed = time.monotonic() - start
+        per_worker = [worker['requests'] for worker in pool.health()]
+    finally:
+        pool.stop()
+    return sum(counts) / elapsed, per_worker
+
+
+def main(duration, max_workers):
+    vasp_bytes = os.urandom(16)
+    vasp_address = LibraAddress.from_bytes(vasp_bytes).as_str()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'claims.sqlite')
+        cdb = shared_claims_db(vasp_address, path)
+        claims = [cdb.add_own_claim(example_claim(vasp_bytes, PORT)) for _ in range(1000)]
+        cdb.storage.close()
+
+        print(f'cores: {os.cpu_count()}, client processes: {CLIENT_PROCESSES}, concurrency: {CONCURRENCY}')
+        workers = 1
+        while workers <= max_workers:
+            throughput, per_worker = run(workers, path, vasp_address, claims, duration)
+            print(f'workers: {workers:2}   {throughput:8.0f} requests/s   per worker: {per_worker}')
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0,
+         int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count())
@@ -0,0 +1,293 @@
+""" Load generator for a local network of VASPs.
+
+Starts K VASPs with `run_service`, each with a ClaimsDB holding M claims,
+either in this process or one subprocess per VASP. Then drives a mix of
+/check, /generate and /attest requests through DynClient, at a fixed
+concurrency (closed loop) or at a target rate (open loop). Reports the
+throughput, p50, p95 and p99 latency and the errors of each route, and
+writes them as JSON to compare across versions.
+
+    python benchmarks/loadgen.py --vasps 3 --claims 1000 --mix check=70,generate=20,attest=10 \\
+        --concurrency 32 --duration 10 --output results.json
+
+/attest traffic needs the libra SDK for the compliance keys. In open loop
+mode, latencies are measured from the time each request was scheduled, so
+that a slow service is not hidden by requests starting late, and requests
+that cannot be sent because too many are in flight are counted as dropped
+(and as errors in the error rate).
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import ClaimsDB, Status
+from example_claims import example_claim
+from client import DynClient
+from libra_address import LibraAddress
+from metrics import LatencyRecorder
+from service import run_service
+
+ROUTES = ('check', 'generate', 'attest')
+
+
+def make_claims_db(seed, index, port, claims, attest):
+    """ Create the ClaimsDB of a VASP, and add its claims. """
+    rng = random.Random(f'{seed}-{index}')
+    vasp_bytes = rng.randbytes(16)
+    compliance_key = None
+    if attest:
+        from crypto import ComplianceKey
+        compliance_key = ComplianceKey.generate()
+
+    # The client of the VASP checks the originator claims of attestations.
+    client = DynClient(check_cache_ttl=0, check_cache_negative_ttl=0)
+    cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str(), compliance_key=compliance_key,
+                   client=client, attest_idempotency_window=0)
+    stored = [
+        cdb.add_own_claim(example_claim(
+            vasp_bytes, port, rng, legal_name=f'Customer {number}', vasp_name=f'VASP on port {port}',
+            bindings={'phone-1': f'+1-465-{number:06}', 'email-1': f'customer{number}@example.com'}))
+        for number in range(claims)
+    ]
+    return cdb, stored
+
+
+async def start_vasp(seed, index, port, claims, attest):
+    cdb, stored = make_claims_db(seed, index, port, claims, attest)
+    runner = await run_service(cdb, 'localhost', port, log_sample_rate=0)
+    return runner, stored
+
+
+def vasp_process(seed, index, port, claims, attest, ready):
+    async def serve():
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stopping.set)
+        runner, stored = await start_vasp(seed, index, port, claims, attest)
+        ready.put((index, stored))
+        await stopping.wait()
+        await runner.cleanup()
+    asyncio.run(serve())
+
+
+class LoadGenerator:
+    """ Sends a mix of requests to the VASPs and records their latencies. """
+
+    def __init__(self, vasp_claims, mix, seed):
+        self.vasp_claims = vasp_claims
+        self.routes = [route for route in ROUTES if mix.get(route, 0) > 0]
+        self.weights = [mix[route] for route in self.routes]
+        self.rng = random.Random(seed)
+        self.client = DynClient(check_cache_ttl=0, check_cache_negative_ttl=0)
+        self.latencies = LatencyRecorder(samples=None)
+        self.errors = {route: 0 for route in self.routes}
+        self.dropped = {route: 0 for route in self.routes}
+        self.recording = False
+
+    def next_route(self):
+        return self.rng.choices(self.routes, self.weights)[0]
+
+    async def request(self, route, scheduled=None):
+        vasp = self.rng.randrange(len(self.vasp_claims))
+        claim = self.rng.choice(self.vasp_claims[vasp])
+        start = scheduled if scheduled is not None else time.monotonic()
+        try:
+            if route == 'check':
+                ok = await self.client.check_other_claim(claim) == Status.correct_record
+            elif route == 'generate':
+                status, _ = await self.client.get_subaddress_from_subaddress(
+                    claim['verification_endpoint'], claim['long_term_subaddress'])
+                ok = status == Status.fresh_dynamic_subaddress
+            else:
+                other = (vasp + 1 + self.rng.randrange(len(self.vasp_claims) - 1)) % len(self.vasp_claims)
+                originator = self.rng.choice(self.vasp_claims[other])
+                result = await self.client.get_attestation(originator, claim, self.rng.randrange(1, 10 ** 9))
+                ok = isinstance(result, tuple) and result[0] == Status.compliance_signature
+        except Exception:
+            ok = False
+        if self.recording:
+            self.latencies.record(route, time.monotonic() - start)
+            if not ok:
+                self.errors[route] += 1
+
+    async def closed_loop(self, concurrency, until):
+        async def worker():
+            while time.monotonic() < until:
+                await self.request(self.next_route())
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    async def open_loop(self, rate, until, max_in_flight=10000):
+        in_flight = set()
+        next_request = time.monotonic()
+        while next_request < until:
+            delay = next_request - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            route = self.next_route()
+            if len(in_flight) < max_in_flight:
+                task = asyncio.ensure_future(self.request(route, scheduled=next_request))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            elif self.recording:
+                # Overloaded: the request is never sent, and counts as an error
+                self.dropped[route] += 1
+            next_request += 1 / rate
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+    async def run(self, duration, warmup, concurrency=None, rate=None, max_in_flight=10000):
+        async def drive(until):
+            if rate is not None:
+                await self.open_loop(rate, until, max_in_flight)
+            else:
+                await self.closed_loop(concurrency, until)
+
+        if warmup > 0:
+            await drive(time.monotonic() + warmup)
+        self.recording = True
+        start = time.monotonic()
+        await drive(start + duration)
+        elapsed = time.monotonic() - start
+        self.recording = False
+        await self.client.close()
+        return elapsed
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        route, _, weight = part.partition('=')
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f'Unknown route {route}, expected one of {", ".join(ROUTES)}')
+        mix[route] = float(weight)
+    return mix
+
+
+async def main(args):
+    mix = args.mix
+    attest = mix.get('attest', 0) > 0
+    if attest and args.vasps < 2:
+        raise SystemExit('/attest traffic needs at least 2 VASPs')
+    ports = [args.base_port + index for index in range(args.vasps)]
+
+    processes, runners = [], []
+    if args.subprocess:
+        ready = multiprocessing.Queue()
+        for index, port in enumerate(ports):
+            process = multiprocessing.Process(
+                target=vasp_process, args=(args.seed, index, port, args.claims, attest, ready), daemon=True)
+            process.start()
+            processes.append(process)
+        vasp_claims = [None] * args.vasps
+        for _ in ports:
+            index, stored = await asyncio.get_running_loop().run_in_executor(None, ready.get, True, 120)
+            vasp_claims[index] = stored
+    else:
+        started = [await start_vasp(args.seed, index, port, args.claims, attest) for index, port in enumerate(ports)]
+        runners = [runner for runner, _ in started]
+        vasp_claims = [stored for _, stored in started]
+
+    try:
+        generator = LoadGenerator(vasp_claims, mix, args.seed)
+        elapsed = await generator.run(args.duration, args.warmup, concurrency=args.concurrency, rate=args.rate,
+                                      max_in_flight=args.max_in_flight)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    summary = generator.latencies.summary()
+    results = {}
+    for route in generator.routes:
+        latencies = summary.get(route)
+        count = latencies['count'] if latencies else 0
+        dropped = generator.dropped[route]
+        results[route] = {
+            'requests': count,
+            'errors': generator.errors[route],
+            'dropped': dropped,
+            'error_rate': (generator.errors[route] + dropped) / (count + dropped) if count + dropped else None,
+            'throughput': count / elapsed,
+            'p50': latencies['p50'] if latencies else None,
+            'p95': latencies['p95'] if latencies else None,
+            'p99': latencies['p99'] if latencies else None,
+            'max': latencies['max'] if latencies else None,
+        }
+
+    report = {
+        'config': {
+            'vasps': args.vasps, 'claims': args.claims, 'mix': mix, 'concurrency': args.concurrency,
+            'rate': args.rate, 'max_in_flight': args.max_in_flight, 'duration': args.duration, 'warmup': args.warmup,
+            'subprocess': args.subprocess, 'seed': args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'git_revision': git_revision(),
+        },
+        'elapsed': elapsed,
+        'throughput': sum(result['requests'] for result in results.values()) / elapsed,
+        'dropped': sum(result['dropped'] for result in results.values()),
+        'routes': results,
+    }
+
+    print(f'{"route":10} {"requests":>9} {"errors":>7} {"dropped":>8} {"req/s":>9} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for route, result in results.items():
+        if result['requests']:
+            print(f'{route:10} {result["requests"]:9} {result["errors"]:7} {result["dropped"]:8} '
+                  f'{result["throughput"]:9.1f} {result["p50"] * 1000:8.2f} {result["p95"] * 1000:8.2f} '
+                  f'{result["p99"] * 1000:8.2f}')
+        elif result['dropped']:
+            print(f'{route:10} {0:9} {result["errors"]:7} {result["dropped"]:8}')
+    print(f'total: {report["throughput"]:.1f} requests/s, {report["dropped"]} dropped')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=4)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vasps', type=int, default=3, help='number of VASPs (K)')
+    parser.add_argument('--claims', type=int, default=1000, help='number of claims per VASP (M)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('check=70,generate=20,attest=10'),
+                        help='relative weights of the routes, e.g. check=70,generate=20,attest=10')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, default=16, help='requests in flight (closed loop)')
+    load.add_argument('--rate', type=float, default=None, help='target requests per second (open loop)')
+    parser.add_argument('--max-in-flight', type=int, default=10000,
+                        help='requests in flight above which the open loop drops requests')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of measured traffic')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds of traffic before measuring')
+    parser.add_argument('--base-port', type=int, default=8300, help='port of the first VASP')
+    parser.add_argument('--subprocess', action='store_true', help='run each VASP in its own process')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the claims and of the traffic')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
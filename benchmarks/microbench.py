@@ -0,0 +1,247 @@
+""" Microbenchmarks of the per-call costs on the hot paths.
+
+Each case times a fixed number of calls on inputs generated from a fixed
+seed, and keeps the best of a few repeats. Times are divided by the time of
+a calibration loop of plain Python work, so that the scores stored in
+benchmarks/baselines.json can be compared across machines.
+
+    python benchmarks/microbench.py                   # compare with the baselines
+    python benchmarks/microbench.py --update-baselines --runs 5
+
+test_microbench.py runs the same comparison as part of the test suite. The
+ComplianceKey cases are skipped when the libra SDK is not installed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import ClaimsDB
+from example_claims import example_claim
+from bech32 import LBR, bech32_address_decode, bech32_address_encode
+from libra_address import LibraAddress
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+SEED = 20200118
+# A case regresses when its score is above its baseline times the threshold.
+DEFAULT_THRESHOLD = 2.0
+
+
+def calibration_work():
+    """ A fixed loop of dict, str and int work, the unit of the scores. """
+    table = {}
+    total = 0
+    for i in range(20000):
+        key = f'key-{i % 512}'
+        table[key] = table.get(key, 0) + i
+        total += len(key) * (i & 7)
+    return total
+
+
+def timed_call(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def random_addresses(rng, count):
+    return [(rng.randbytes(16), rng.randbytes(8)) for _ in range(count)]
+
+
+def bech32_encode(rng):
+    pairs = random_addresses(rng, 256)
+
+    def run():
+        for address_bytes, subaddress_bytes in pairs:
+            bech32_address_encode(LBR, address_bytes, subaddress_bytes)
+    return run, len(pairs)
+
+
+def bech32_decode(rng):
+    encoded = [bech32_address_encode(LBR, *pair) for pair in random_addresses(rng, 256)]
+
+    def run():
+        for address in encoded:
+            bech32_address_decode(address)
+    return run, len(encoded)
+
+
+def libra_address_parse(rng):
+    # Distinct addresses, parsed without the cache of from_encoded_str
+    encoded = [LibraAddress.from_bytes(*pair).as_str() for pair in random_addresses(rng, 256)]
+
+    def run():
+        for address in encoded:
+            LibraAddress._parse(address)
+    return run, len(encoded)
+
+
+def libra_address_cached(rng):
+    encoded = [LibraAddress.from_bytes(*pair).as_str() for pair in random_addresses(rng, 256)]
+    for address in encoded:
+        LibraAddress.from_encoded_str(address)
+
+    def run():
+        for address in encoded:
+            LibraAddress.from_encoded_str(address)
+    return run, len(encoded)
+
+
+def compliance_key_cases():
+    try:
+        from crypto import ComplianceKey
+    except ImportError:
+        return None
+
+    def sign(rng):
+        key = ComplianceKey.generate()
+        items = [(f'ref-{rng.getrandbits(64):016x}', rng.randbytes(16), rng.randrange(10 ** 9))
+                 for _ in range(64)]
+
+        def run():
+            for item in items:
+                key.sign_dual_attestation_data(*item)
+        return run, len(items)
+
+    def verify(rng):
+        key = ComplianceKey.generate()
+        items = [(f'ref-{rng.getrandbits(64):016x}', rng.randbytes(16), rng.randrange(10 ** 9))
+                 for _ in range(64)]
+        items = [item + (key.sign_dual_attestation_data(*item),) for item in items]
+
+        def run():
+            for item in items:
+                key.verify_dual_attestation_data(*item)
+        return run, len(items)
+
+    return sign, verify
+
+
+def run_in_loop(coroutine_function, count):
+    async def calls():
+        for _ in range(count):
+            await coroutine_function()
+
+    def run():
+        asyncio.run(calls())
+    return run
+
+
+def check_own_claim(shape):
+    def case(rng):
+        vasp_bytes = rng.randbytes(16)
+        cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str())
+        claim = cdb.add_own_claim(example_claim(vasp_bytes, rng=rng, shape=shape))
+        return run_in_loop(lambda: cdb.check_own_claim(claim), 500), 500
+    return case
+
+
+def generate_dynamic_subaddress(dyn_size):
+    def case(rng):
+        vasp_bytes = rng.randbytes(16)
+        cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str())
+        claim = cdb.add_own_claim(example_claim(vasp_bytes, rng=rng, shape='beneficiary'))
+        cdb.dyn_DB.update((rng.randbytes(8), claim['unique_identifier']) for _ in range(dyn_size))
+        return run_in_loop(lambda: cdb.generate_dynamic_subaddress(claim), 200), 200
+    return case
+
+
+def cases():
+    """ Return the benchmark cases by name, with None for the cases that
+    cannot run here. Each case takes a seeded Random and returns a function
+    and the number of calls it makes. """
+    compliance_key = compliance_key_cases()
+    return {
+        'bech32_address_encode': bech32_encode,
+        'bech32_address_decode': bech32_decode,
+        'libra_address_parse': libra_address_parse,
+        'libra_address_from_encoded_str_cached': libra_address_cached,
+        'sign_dual_attestation_data': compliance_key[0] if compliance_key else None,
+        'verify_dual_attestation_data': compliance_key[1] if compliance_key else None,
+        'check_own_claim_flat': check_own_claim('beneficiary'),
+        'check_own_claim_wide': check_own_claim('wide'),
+        'check_own_claim_deep': check_own_claim('deep'),
+        'generate_dynamic_subaddress_empty': generate_dynamic_subaddress(0),
+        'generate_dynamic_subaddress_100k': generate_dynamic_subaddress(100000),
+    }
+
+
+def score(case, repeat=9):
+    """ Return the time per call of a case, in units of the calibration loop.
+
+    The case and the calibration loop run alternately and the best time of
+    each is kept, so that both see the same load of the machine.
+    """
+    function, number = case(random.Random(SEED))
+    function()  # Warm up
+    best_case = best_calibration = None
+    for _ in range(repeat):
+        elapsed = timed_call(calibration_work)
+        best_calibration = elapsed if best_calibration is None else min(best_calibration, elapsed)
+        elapsed = timed_call(function) / number
+        best_case = elapsed if best_case is None else min(best_case, elapsed)
+    return best_case / best_calibration
+
+
+def scores(names=None, runs=1):
+    """ Return the median score of each case that can run here, over runs. """
+    results = {}
+    for name, case in cases().items():
+        if case is not None and (names is None or name in names):
+            results[name] = statistics.median(score(case) for _ in range(runs))
+    return results
+
+
+def load_baselines(path=BASELINES):
+    with open(path) as baselines:
+        return json.load(baselines)
+
+
+def main(args):
+    baselines = load_baselines() if os.path.exists(BASELINES) else {'cases': {}}
+    threshold = args.threshold or baselines.get('threshold', DEFAULT_THRESHOLD)
+    results = scores(runs=args.runs)
+
+    regressions = []
+    print(f'{"case":40} {"score":>10} {"baseline":>10} {"ratio":>6}')
+    for name, case in cases().items():
+        if name not in results:
+            print(f'{name:40} skipped')
+            continue
+        baseline = baselines['cases'].get(name)
+        if baseline is None:
+            print(f'{name:40} {results[name]:10.6f} {"-":>10} {"-":>6}')
+            continue
+        ratio = results[name] / baseline
+        if ratio > threshold:
+            regressions.append(name)
+        print(f'{name:40} {results[name]:10.6f} {baseline:10.6f} {ratio:6.2f}')
+
+    if args.update_baselines:
+        # Keep the baselines of the cases that were skipped here
+        baselines['cases'].update(results)
+        baselines['threshold'] = threshold
+        with open(BASELINES, 'w') as output:
+            json.dump(baselines, output, indent=4, sort_keys=True)
+            output.write('\n')
+        print(f'baselines written to {BASELINES}')
+    elif regressions:
+        print(f'regressions (above {threshold}x the baseline): {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update-baselines', action='store_true', help='store the scores as the new baselines')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help=f'ratio to the baseline above which a case regresses (default {DEFAULT_THRESHOLD})')
+    parser.add_argument('--runs', type=int, default=1, help='number of runs to take the median score of')
+    sys.exit(main(parser.parse_args()))
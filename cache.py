@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+
+def canonical_digest(*values):
+    """ Return a hex digest of JSON values that does not depend on the order
+    of the keys of their dicts. """
+    data = json.dumps(values, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class TTLCache:
+    """ A bounded LRU cache of results that expire after a time to live.
+
+    Results for which `is_negative(value)` holds expire after `negative_ttl`
+    instead (they are not cached at all if it is 0). Concurrent calls to
+    `get_or_compute` for the same key are coalesced into a single computation,
+    whose result (or exception) is shared by all callers. Exceptions are never
+    cached. With a ttl of math.inf, entries only leave the cache when evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, negative_ttl=None, is_negative=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.is_negative = is_negative
+        self.clock = clock
+
+        self._entries = OrderedDict()  # key -> (value, stored_at, expires_at)
+        self._in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= self.clock():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        """ Return the cached value for key, or default. """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """ Cache a value for key, with the ttl that applies to it. """
+        negative = self.is_negative is not None and self.is_negative(value)
+        ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        now = self.clock()
+        self._entries[key] = (value, now, now + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """ Remove a key from the cache, or all keys if none is given. """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        """ Remove all keys for which predicate(key) holds. """
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    async def get_or_compute(self, key, compute):
+        """ Return the cached value for key, or await compute() to get it.
+
+        The computation runs in a task of its own, so cancelling one of the
+        callers waiting for it cancels neither the computation nor the other
+        callers. A disabled cache (with no ttl or no room) calls compute()
+        every time. """
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+
+        if self.maxsize <= 0 or max(self.ttl, self.negative_ttl) <= 0:
+            # The cache is disabled
+            self.misses += 1
+            return await compute()
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(_retrieve_exception)
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+        finally:
+            del self._in_flight[key]
+        self.put(key, value)
+        return value
+
+    def stats(self):
+        """ Return the counters of the cache and the ages of its entries. """
+        now = self.clock()
+        ages = [now - stored_at for _, stored_at, _ in self._entries.values()]
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'in_flight': len(self._in_flight),
+            'oldest_age': max(ages) if ages else None,
+            'mean_age': sum(ages) / len(ages) if ages else None,
+        }
+
+
+def _retrieve_exception(task):
+    # Avoid warnings about an exception that every caller stopped waiting for
+    if not task.cancelled():
+        task.exception()
@@ -1,46 +1,206 @@
 
 
+import asyncio
+import json
+from collections import deque
+
 import aiohttp
 from backend import Status
+from cache import TTLCache, canonical_digest
+from metrics import timed
 
 
 class DynClient():
-    def __init__(self, custom_checker = None):
+    """ A client for the service of other VASPs.
+
+    All requests share one HTTP session with a connection pool, which keeps
+    connections to each host alive between calls. The session is created on
+    first use and should be released with `close`, or by using the client as
+    an async context manager. Used from another event loop, the client closes
+    the session of the previous loop and creates a new one.
+
+    The results of `check_other_claim` are cached for `check_cache_ttl`
+    seconds (`check_cache_negative_ttl` for results other than a correct
+    record), and the decisions of the custom checker for `binding_cache_ttl`
+    seconds (`binding_cache_negative_ttl` for rejected bindings). Set a ttl to
+    0 to disable a cache.
+    """
+
+    def __init__(self, custom_checker = None, limit=100, limit_per_host=20,
+                 keepalive_timeout=30, timeout=30, connect_timeout=10,
+                 check_cache_size=4096, check_cache_ttl=60, check_cache_negative_ttl=5,
+                 binding_cache_size=4096, binding_cache_ttl=300, binding_cache_negative_ttl=30,
+                 metrics=None):
         self._checker = custom_checker
-
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._session = None
+        self._session_loop = None
+        self._closing_sessions = set()
+
+        # Latency histograms of the calls, if a MetricsRegistry is set (see metrics.py)
+        self.metrics = metrics
+
+        self.check_cache = TTLCache(
+            maxsize=check_cache_size,
+            ttl=check_cache_ttl,
+            negative_ttl=check_cache_negative_ttl,
+            is_negative=lambda status: status != Status.correct_record,
+        )
+        self.binding_cache = TTLCache(
+            maxsize=binding_cache_size,
+            ttl=binding_cache_ttl,
+            negative_ttl=binding_cache_negative_ttl,
+            is_negative=lambda bound: not bound,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def session(self):
+        """ Return the shared HTTP session, creating it if needed. """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            if self._session is not None and not self._session.closed:
+                # A session cannot be used on another event loop: close it
+                # from this one, so that its connector releases its connections.
+                task = loop.create_task(_close_stale_session(self._session))
+                self._closing_sessions.add(task)
+                task.add_done_callback(self._closing_sessions.discard)
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        """ Close the shared HTTP session and its connections. """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @timed('dyn_client_duration_seconds', 'check_binding')
     async def check_binding(self, libra_address, url):
         if self._checker is None:
             return True
         else:
-            return await self._checker(libra_address, url)
-
+            return await self.binding_cache.get_or_compute(
+                (libra_address, url),
+                lambda: self._checker(libra_address, url)
+            )
+
+    async def check_bindings(self, bindings):
+        """ Check many (libra_address, url) bindings concurrently, and return
+        the list of their results. """
+        return await asyncio.gather(*[
+            self.check_binding(libra_address, url) for libra_address, url in bindings
+        ])
+
+    def invalidate_binding(self, libra_address=None, url=None):
+        """ Forget the cached decisions about the bindings of libra_address to
+        url, if either is None all addresses or urls match. """
+        self.binding_cache.invalidate_matching(
+            lambda key: (libra_address is None or key[0] == libra_address)
+            and (url is None or key[1] == url)
+        )
+
+    @timed('dyn_client_duration_seconds', 'check_other_claim')
     async def check_other_claim(self, claim):
-        async with aiohttp.ClientSession() as session:
+        key = canonical_digest(claim, claim['verification_endpoint'])
+        return await self.check_cache.get_or_compute(key, lambda: self._check_other_claim(claim))
 
-            if await self.check_binding(claim['vasp_libra_address'], claim['verification_endpoint']):
-                async with session.post(claim['verification_endpoint'] + '/check', json=claim) as resp:
-                    response = await resp.json()
-
-                return Status[response['status']]
-            else:
-                return Status.incorrect_address
+    async def _check_other_claim(self, claim):
+        if await self.check_binding(claim['vasp_libra_address'], claim['verification_endpoint']):
+            async with self.session().post(claim['verification_endpoint'] + '/check', json=claim) as resp:
+                response = await resp.json()
 
+            return Status[response['status']]
+        else:
+            return Status.incorrect_address
+
+    async def check_other_claims(self, url, claims):
+        """ Check the claims of an async iterator with the /check_batch
+        service at url, and yield their statuses in order, as they arrive.
+
+        Claims are sent as they are produced, without waiting for earlier
+        results. Claims whose vasp_libra_address is not bound to url are
+        not sent, and get Status.incorrect_address. Raises
+        aiohttp.ClientResponseError if the service answers with an error
+        status, and aiohttp.ClientPayloadError if it does not answer with
+        exactly one result per claim sent. """
+        # The statuses of the claims sent so far, None until they arrive
+        pending = deque()
+
+        async def send():
+            async for claim in claims:
+                if await self.check_binding(claim['vasp_libra_address'], url):
+                    pending.append(None)
+                    yield (json.dumps(claim) + '\n').encode('utf-8')
+                else:
+                    pending.append(Status.incorrect_address)
+
+        headers = {'Content-Type': 'application/x-ndjson'}
+        async with self.session().post(url + '/check_batch', data=send(), headers=headers) as resp:
+            resp.raise_for_status()
+            async for line in resp.content:
+                if not line.strip():
+                    continue
+                while pending and pending[0] is not None:
+                    yield pending.popleft()
+                if not pending:
+                    raise aiohttp.ClientPayloadError('More results than claims in the /check_batch response')
+                pending.popleft()
+                yield Status[json.loads(line)['status']]
+
+        while pending:
+            status = pending.popleft()
+            if status is None:
+                raise aiohttp.ClientPayloadError('Missing results in the /check_batch response')
+            yield status
+
+    @timed('dyn_client_duration_seconds', 'get_subaddress_from_subaddress')
     async def get_subaddress_from_subaddress(self, url, subaddress):
         request = {
             'subaddress' : subaddress,
         }
 
-        async with aiohttp.ClientSession() as session:
+        if await self.check_binding(subaddress, url):
+            async with self.session().post(url + '/generate', json=request) as resp:
+                response = await resp.json()
 
-            if await self.check_binding(subaddress, url):
-                async with session.post(url + '/generate', json=request) as resp:
-                    response = await resp.json()
+            return (Status[response['status']], response.get('dynamic_subaddress', None))
+        else:
+            return Status.incorrect_address
 
-                return (Status[response['status']], response.get('dynamic_subaddress', None))
-            else:
-                return Status.incorrect_address
+    @timed('dyn_client_duration_seconds', 'get_subaddresses_from_subaddress')
+    async def get_subaddresses_from_subaddress(self, url, subaddress, count):
+        request = {
+            'subaddress' : subaddress,
+            'count' : count,
+        }
+
+        if await self.check_binding(subaddress, url):
+            async with self.session().post(url + '/generate_batch', json=request) as resp:
+                response = await resp.json()
 
-    async def get_attestation(self, originator_record, beneficiary_record, amount):
+            return (Status[response['status']], response.get('dynamic_subaddresses', None))
+        else:
+            return Status.incorrect_address
+
+    @timed('dyn_client_duration_seconds', 'get_attestation')
+    async def get_attestation(self, originator_record, beneficiary_record, amount, idempotency_key=None):
+        """ Request a compliance signature from the beneficiary VASP. Retries
+        with the same idempotency_key get the same reference_id and signature. """
         request = {
             'beneficiary_travel_rule_record' : beneficiary_record,
             'originator_travel_rule_record'  : originator_record,
@@ -48,17 +208,25 @@ class DynClient():
         }
 
         url = beneficiary_record['verification_endpoint'] + '/attest'
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key is not None else None
 
-        async with aiohttp.ClientSession() as session:
+        if await self.check_binding(beneficiary_record['vasp_libra_address'], beneficiary_record['verification_endpoint']):
+            async with self.session().post(url, json=request, headers=headers) as resp:
+                response = await resp.json()
 
-            if await self.check_binding(beneficiary_record['vasp_libra_address'], beneficiary_record['verification_endpoint']):
-                async with session.post(url, json=request) as resp:
-                    response = await resp.json()
+            if Status[response['status']] != Status.compliance_signature:
+                return Status[response['status']]
+            else:
+                return (Status[response['status']], response['reference_id'], response['compliance_signature'])
 
-                if Status[response['status']] != Status.compliance_signature:
-                    return Status[response['status']]
-                else:
-                    return (Status[response['status']], response['reference_id'], response['compliance_signature'])
+        else:
+            return Status.incorrect_address
 
-            else:
-                return Status.incorrect_address
+
+async def _close_stale_session(session):
+    try:
+        await session.close()
+    except RuntimeError:
+        # Its connections are closed, but waiting for them to be closed
+        # needs the event loop they were opened on.
+        pass
@@ -1,10 +1,12 @@
 # Copyright (c) The Libra Core Contributors
 # SPDX-License-Identifier: Apache-2.0
 
-from jwcrypto.common import base64url_encode
+from jwcrypto.common import base64url_encode, base64url_decode, json_encode
 from cryptography.exceptions import InvalidSignature
 from libra import txnmetadata, utils
 from jwcrypto import jwk, jws
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import binascii
 import json
 
 
@@ -17,17 +19,33 @@ class IncorrectInputException(Exception):
 
 
 
+# The protected headers of compact EdDSA signatures that can be verified
+# without going through jwcrypto: none (as produced by `sign_message`), or
+# only the algorithm.
+_EDDSA_PROTECTED_HEADERS = {'', base64url_encode(json_encode({'alg': 'EdDSA'}))}
+
+
 class ComplianceKey:
 
     def __init__(self, key):
         ''' Creates a compliance key from a JWK Ed25519 key. '''
         self._key = key
+        # The cryptography key objects, materialized on first use
+        self._public = None
+        self._private = None
+
+    def has_private(self):
+        return self._key.has_private
 
     def get_public(self):
-        return self._key.get_op_key('verify')
+        if self._public is None:
+            self._public = self._key.get_op_key('verify')
+        return self._public
 
     def get_private(self):
-        return self._key.get_op_key('sign')
+        if self._private is None:
+            self._private = self._key.get_op_key('sign')
+        return self._private
 
     @staticmethod
     def generate():
@@ -72,12 +90,31 @@ class ComplianceKey:
         return self._key.export_private()
 
     async def sign_message(self, payload):
-        signer = jws.JWS(payload.encode('utf-8'))
-        signer.add_signature(self._key, alg='EdDSA')
-        sig = signer.serialize(compact=True)
-        return sig
+        ''' Sign a str payload as a compact EdDSA JWS without protected
+        header, as `jws.JWS.add_signature(key, alg='EdDSA')` does. '''
+        signing_input = '.' + base64url_encode(payload.encode('utf-8'))
+        signature = self.get_private().sign(signing_input.encode('ascii'))
+        return signing_input + '.' + base64url_encode(signature)
 
     async def verify_message(self, signature):
+        parts = signature.split('.')
+        if len(parts) != 3 or parts[0] not in _EDDSA_PROTECTED_HEADERS:
+            return self._verify_message_jws(signature)
+
+        protected, payload, encoded_signature = parts
+        try:
+            signing_input = (protected + '.' + payload).encode('ascii')
+            payload_bytes = base64url_decode(payload)
+            signature_bytes = base64url_decode(encoded_signature)
+        except (UnicodeEncodeError, binascii.Error, ValueError):
+            raise OffChainInvalidSignature(signature, "Invalid Format")
+        try:
+            self.get_public().verify(signature_bytes, signing_input)
+        except InvalidSignature:
+            raise OffChainInvalidSignature(signature, "Invalid Signature")
+        return payload_bytes.decode("utf-8")
+
+    def _verify_message_jws(self, signature):
         try:
             verifier = jws.JWS()
             verifier.deserialize(signature)
@@ -140,3 +177,84 @@ class ComplianceKey:
                 amount,
                 signature
             )
+
+    def verify_dual_attestation_batch(self, items, executor=None, max_workers=4, chunk_size=256):
+        """
+        Verify many dual attestation signatures.
+            Params:
+               items: (reference_id, libra_address_bytes, amount, signature) tuples,
+                   as for verify_dual_attestation_data
+               executor: None to verify in the calling thread, 'thread' or
+                   'process' to verify on a new pool of max_workers, or an
+                   existing concurrent.futures.Executor
+               chunk_size (int): the number of items verified per task
+            Returns a list with, for each item, None when verification succeeds
+            or the exception that verification raised.
+        """
+        items = list(items)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        if executor is None:
+            results = [self._verify_dual_attestation_chunk(chunk) for chunk in chunks]
+        elif executor == 'thread':
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(self._verify_dual_attestation_chunk, chunks))
+        elif executor == 'process':
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = self._map_dual_attestation_chunks(pool, chunks)
+        elif isinstance(executor, Executor):
+            results = self._map_dual_attestation_chunks(executor, chunks)
+        else:
+            raise ValueError(f'Unknown executor {executor}, expected "thread", "process" or an Executor')
+
+        return [result for chunk in results for result in chunk]
+
+    def _map_dual_attestation_chunks(self, executor, chunks):
+        if isinstance(executor, ProcessPoolExecutor):
+            # Worker processes load the public key once, from its JWK export.
+            key_data = [self.export_pub()] * len(chunks)
+            return list(executor.map(_verify_dual_attestation_chunk, key_data, chunks))
+        return list(executor.map(self._verify_dual_attestation_chunk, chunks))
+
+    def _verify_dual_attestation_chunk(self, chunk):
+        public_key = self.get_public()
+        addresses = {}
+        messages = []
+        for reference_id, libra_address_bytes, amount, signature in chunk:
+            try:
+                if libra_address_bytes not in addresses:
+                    addresses[libra_address_bytes] = utils.account_address(bytes.hex(libra_address_bytes))
+                _, dual_attestation_msg = txnmetadata.travel_rule(
+                    reference_id, addresses[libra_address_bytes], amount)
+                messages.append(dual_attestation_msg)
+            except Exception as e:
+                messages.append(e)
+
+        results = []
+        for (reference_id, libra_address_bytes, amount, signature), message in zip(chunk, messages):
+            if isinstance(message, Exception):
+                results.append(message)
+                continue
+            try:
+                public_key.verify(signature, message)
+                results.append(None)
+            except InvalidSignature:
+                results.append(OffChainInvalidSignature(
+                    reference_id,
+                    libra_address_bytes,
+                    amount,
+                    signature
+                ))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+# The compliance keys of a worker process, by JWK export
+_worker_keys = {}
+
+
+def _verify_dual_attestation_chunk(key_data, chunk):
+    if key_data not in _worker_keys:
+        _worker_keys[key_data] = ComplianceKey.from_str(key_data)
+    return _worker_keys[key_data]._verify_dual_attestation_chunk(chunk)
@@ -0,0 +1,46 @@
+""" The example claims used by the tests and the benchmarks. """
+
+import os
+
+from libra_address import LibraAddress
+
+
+def example_claim(vasp_bytes, port=8080, rng=None, shape='originator', **fields):
+    """ Return a claim of a customer of the VASP with address vasp_bytes,
+    served at localhost:port, with a fresh long term subaddress drawn from
+    rng (a random.Random) or os.urandom.
+
+    The shape is 'originator' (with bindings and originator data),
+    'beneficiary' (without them), 'wide' (200 bindings) or 'deep'
+    (originator data nested 30 levels deep). Other keyword arguments
+    override fields of the claim.
+    """
+    random_bytes = rng.randbytes if rng is not None else os.urandom
+    claim = {
+        'legal_name': 'Adam Smith',
+        'long_term_subaddress': LibraAddress.from_bytes(vasp_bytes, random_bytes(8)).as_str(),
+        'vasp_name': 'Example VASP inc.',
+        'vasp_libra_address': LibraAddress.from_bytes(vasp_bytes).as_str(),
+        'issue_date': '2020-01-18',
+        'expiry_date': '2022-01-18',
+        'unique_identifier': None,
+        'verification_endpoint': f'http://localhost:{port}',
+    }
+    if shape == 'originator':
+        claim['bindings'] = {'phone-1': '+1-465-883772', 'email-1': 'adam@smith.com'}
+        claim['originator_data'] = {
+            'date_of_birth': '1958-04-22',
+            'place_of_birth': 'United Kingdom',
+            'identity': {'passport_number': '77tjjjr774'}
+        }
+    elif shape == 'wide':
+        claim['bindings'] = {f'email-{i}': f'user{i}@example.com' for i in range(200)}
+    elif shape == 'deep':
+        nested = {'passport_number': '77tjjjr774'}
+        for level in range(30):
+            nested = {f'level-{level}': nested, f'note-{level}': str(level)}
+        claim['originator_data'] = nested
+    elif shape != 'beneficiary':
+        raise ValueError(f'Unknown claim shape {shape}')
+    claim.update(fields)
+    return claim
@@ -0,0 +1,32 @@
+import heapq
+
+
+class ExpiryHeap:
+    """ A min-heap of (expiry time, key) pairs, so that the keys expired at a
+    given time are found in O(log n) each, without scanning the others.
+
+    Keys are not removed from the heap when they are deleted early: callers
+    check that a key popped from the heap still expires at that time. """
+
+    def __init__(self, entries=()):
+        self._heap = list(entries)
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, expires_at, key):
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def next_expiry(self):
+        """ Return the earliest expiry time, or None if the heap is empty. """
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now, limit=None):
+        """ Remove and return the (expiry time, key) pairs expired at now,
+        earliest first, at most limit of them. """
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and (limit is None or len(expired) < limit):
+            expired.append(heapq.heappop(heap))
+        return expired
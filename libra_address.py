@@ -2,9 +2,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from binascii import unhexlify, hexlify
+from functools import lru_cache
 from bech32 import (
     bech32_address_encode,
     bech32_address_decode,
+    bech32_address_template,
+    bech32_template_encode,
+    bech32_template_encode_many,
     Bech32Error,
     LBR,
     TLB,
@@ -12,6 +16,10 @@ from bech32 import (
 )
 
 
+# Maximum number of parsed addresses kept by LibraAddress.from_encoded_str
+LIBRA_ADDRESS_CACHE_SIZE = 4096
+
+
 class LibraAddressError(Exception):
     ''' Represents an error when creating a LibraAddress. '''
     pass
@@ -25,8 +33,12 @@ class LibraAddress:
     3. hrp: Human Readable Part, indicating the network version:
         * "lbr" for Mainnet addresses
         * "tlb" for Testnet addresses
+
+    LibraAddress objects are immutable.
     """
 
+    __slots__ = ('encoded_address_bytes', 'onchain_address_bytes', 'subaddress_bytes', 'hrp', '_onchain')
+
     @classmethod
     def from_bytes(cls, onchain_address_bytes, subaddress_bytes=None, hrp=LBR):
         """ Return a LibraAddress given onchain address in bytes, subaddress
@@ -58,7 +70,17 @@ class LibraAddress:
 
     @classmethod
     def from_encoded_str(cls, encoded_str):
-        """ Return a LibraAddress given an bech32 encoded str """
+        """ Return a LibraAddress given an bech32 encoded str.
+
+        Parsed addresses are kept in a bounded LRU cache keyed by the encoded
+        str, so repeated calls return the same object (see `cache_info`).
+        """
+        if cls is LibraAddress:
+            return _parse_encoded_str(encoded_str)
+        return cls._parse(encoded_str)
+
+    @classmethod
+    def _parse(cls, encoded_str):
         try:
             hrp, _version, onchain_address_bytes, subaddress_bytes = bech32_address_decode(encoded_str)
         except Bech32Error as e:
@@ -71,14 +93,45 @@ class LibraAddress:
             return cls(encoded_str, onchain_address_bytes, subaddress_bytes, hrp)
         return cls(encoded_str, onchain_address_bytes, None, hrp)
 
+    @staticmethod
+    def cache_info():
+        """ Return the hits, misses, maxsize and currsize of the cache used
+        by `from_encoded_str`. """
+        return _parse_encoded_str.cache_info()
+
+    @staticmethod
+    def cache_clear():
+        """ Empty the cache used by `from_encoded_str` and reset its counters. """
+        _parse_encoded_str.cache_clear()
+
+    @staticmethod
+    def set_cache_size(maxsize):
+        """ Resize (and empty) the cache used by `from_encoded_str`. """
+        global _parse_encoded_str
+        _parse_encoded_str = lru_cache(maxsize=maxsize)(_parse_encoded_str.__wrapped__)
 
     def __init__(self, encoded_address_bytes, onchain_address_bytes, subaddress_bytes, hrp):
         """ DO NOT CALL THIS DIRECTLY!! use factory methods instead."""
 
-        self.encoded_address_bytes = encoded_address_bytes
-        self.onchain_address_bytes = onchain_address_bytes
-        self.subaddress_bytes = subaddress_bytes
-        self.hrp = hrp
+        object.__setattr__(self, 'encoded_address_bytes', encoded_address_bytes)
+        object.__setattr__(self, 'onchain_address_bytes', onchain_address_bytes)
+        object.__setattr__(self, 'subaddress_bytes', subaddress_bytes)
+        object.__setattr__(self, 'hrp', hrp)
+        object.__setattr__(self, '_onchain', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"LibraAddress is immutable, can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"LibraAddress is immutable, can't delete {name}")
+
+    def __reduce__(self):
+        return (self.__class__, (
+            self.encoded_address_bytes,
+            self.onchain_address_bytes,
+            self.subaddress_bytes,
+            self.hrp,
+        ))
 
     def __repr__(self):
         return (
@@ -130,7 +183,10 @@ class LibraAddress:
             without any subaddress information. """
         if self.subaddress_bytes is None:
             return self
-        return LibraAddress.from_bytes(self.onchain_address_bytes, None, self.hrp)
+        if self._onchain is None:
+            onchain = LibraAddress.from_bytes(self.onchain_address_bytes, None, self.hrp)
+            object.__setattr__(self, '_onchain', onchain)
+        return self._onchain
 
     def get_onchain_encoded_str(self):
         """ Return an encoded str representation of LibraAddress containing
@@ -146,3 +202,66 @@ class LibraAddress:
         if self.subaddress_bytes:
             return bytes.hex(self.subaddress_bytes)
         return None
+
+
+class LibraAddressTemplate:
+    """
+    Derives LibraAddresses for many subaddresses of the same onchain address,
+    without re-encoding the onchain part for each of them.
+    """
+
+    __slots__ = ('onchain_address', '_template')
+
+    def __init__(self, onchain_address):
+        """ Create a template for the onchain part of a LibraAddress. """
+        onchain_address = onchain_address.get_onchain()
+        self.onchain_address = onchain_address
+        self._template = bech32_address_template(
+            onchain_address.hrp,
+            onchain_address.onchain_address_bytes
+        )
+
+    @classmethod
+    def from_encoded_str(cls, encoded_str):
+        """ Return a template for the onchain part of an bech32 encoded str """
+        return cls(LibraAddress.from_encoded_str(encoded_str))
+
+    def encode(self, subaddress_bytes):
+        """ Return the encoded str of the onchain address with the given
+        subaddress in bytes. """
+        try:
+            return bech32_template_encode(self._template, subaddress_bytes)
+        except Bech32Error as e:
+            raise LibraAddressError(
+                f"Can't create LibraAddress from template {self.onchain_address}, "
+                f"subaddress_bytes: {subaddress_bytes}, got Bech32Error: {e}"
+            )
+
+    def encode_many(self, subaddresses):
+        """ Return the encoded strs of the onchain address with each of the
+        given subaddresses in bytes. """
+        try:
+            return bech32_template_encode_many(self._template, subaddresses)
+        except Bech32Error as e:
+            raise LibraAddressError(
+                f"Can't create LibraAddresses from template {self.onchain_address}, "
+                f"got Bech32Error: {e}"
+            )
+
+    def from_subaddress_bytes(self, subaddress_bytes):
+        """ Return the LibraAddress of the onchain address with the given
+        subaddress in bytes. """
+        encoded_address = self.encode(subaddress_bytes)
+        if subaddress_bytes is None:
+            return self.onchain_address
+        return LibraAddress(
+            encoded_address,
+            self.onchain_address.onchain_address_bytes,
+            subaddress_bytes,
+            self.onchain_address.hrp
+        )
+
+
+@lru_cache(maxsize=LIBRA_ADDRESS_CACHE_SIZE)
+def _parse_encoded_str(encoded_str):
+    return LibraAddress._parse(encoded_str)
@@ -0,0 +1,143 @@
+import functools
+import time
+from bisect import bisect_left
+from collections import deque
+
+
+class LatencyRecorder:
+    """ Keeps the latest `samples` durations (in seconds) of named steps (all
+    of them if `samples` is None), and summarizes them as percentiles. """
+
+    def __init__(self, samples=1024):
+        self.samples = samples
+        self._steps = {}
+        self._counts = {}
+
+    def record(self, step, seconds):
+        if step not in self._steps:
+            self._steps[step] = deque(maxlen=self.samples)
+            self._counts[step] = 0
+        self._steps[step].append(seconds)
+        self._counts[step] += 1
+
+    def summary(self):
+        """ Return, for each step, its total count and the p50, p90, p95, p99
+        and maximum of its latest durations. """
+        summary = {}
+        for step, durations in self._steps.items():
+            ordered = sorted(durations)
+            summary[step] = {
+                'count': self._counts[step],
+                'p50': _percentile(ordered, 0.50),
+                'p90': _percentile(ordered, 0.90),
+                'p95': _percentile(ordered, 0.95),
+                'p99': _percentile(ordered, 0.99),
+                'max': ordered[-1],
+            }
+        return summary
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# The upper bounds (in seconds) of the buckets of latency histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'dyn_http_requests_total': 'HTTP requests, by route, method and HTTP status code.',
+    'dyn_http_responses_total': 'HTTP responses, by route and Status value.',
+    'dyn_http_request_duration_seconds': 'Time to handle HTTP requests, by route.',
+    'dyn_claims_db_duration_seconds': 'Time spent in ClaimsDB operations.',
+    'dyn_attest_step_duration_seconds': 'Time spent in the steps of attestations.',
+    'dyn_client_duration_seconds': 'Time spent in DynClient calls to other VASPs.',
+}
+
+
+class MetricsRegistry:
+    """ Counters and latency histograms with labels, rendered in the
+    Prometheus text exposition format. """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}     # name -> {labels: value}
+        self._histograms = {}   # name -> {labels: [bucket counts..., +Inf count, sum, count]}
+
+    def inc(self, name, value=1, **labels):
+        """ Add value to the counter name with the given labels. """
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """ Record a duration in the histogram name with the given labels. """
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        state = series.get(key)
+        if state is None:
+            state = series[key] = [0] * (len(self.buckets) + 3)
+        state[bisect_left(self.buckets, seconds)] += 1
+        state[-2] += seconds
+        state[-1] += 1
+
+    def total(self, name):
+        """ Return the sum of the counter name over all its labels. """
+        return sum(self._counters.get(name, {}).values())
+
+    def render(self):
+        """ Return all metrics in the Prometheus text exposition format. """
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            _describe(lines, name, 'counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for name, series in sorted(self._histograms.items()):
+            _describe(lines, name, 'histogram')
+            for labels, state in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(bounds, state):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(state[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {state[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def timed(metric, operation):
+    """ Decorate an async method to record its durations in the histogram
+    `metric` of `self.metrics` (if it is not None), labelled by operation. """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return await method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                metrics.observe(metric, time.perf_counter() - start, operation=operation)
+        return wrapper
+    return decorator
+
+
+def _describe(lines, name, kind):
+    if name in METRIC_HELP:
+        lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import random
+import sys
+import time
+
+
+class RequestLogger:
+    """ Logs the requests and responses of the service handlers as one compact
+    JSON line per request.
+
+    Handlers only enqueue records: a background task takes them off the queue
+    in batches, and serializes and writes them on an executor thread. Only a
+    `sample_rate` fraction of requests is logged, but records with an error
+    are always logged. Request payloads are cut to `max_payload` characters.
+    When the queue is full, records are dropped and counted.
+    """
+
+    def __init__(self, stream=None, sample_rate=1.0, max_payload=2048, queue_size=10000, max_batch=256):
+        self.stream = stream if stream is not None else sys.stdout
+        self.sample_rate = sample_rate
+        self.max_payload = max_payload
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+
+        self._queue = None
+        self._task = None
+        self._writing = None
+
+        self.logged = 0
+        self.dropped = 0
+
+    def start(self):
+        """ Start the background writer task, on the running event loop. """
+        if self._task is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._task = asyncio.get_running_loop().create_task(self._write_forever())
+
+    async def stop(self):
+        """ Write the queued records and stop the background writer task. """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Let the write in progress finish, so that lines stay in order
+            if self._writing is not None:
+                await self._writing
+                self._writing = None
+            records = []
+            while not self._queue.empty():
+                records.append(self._queue.get_nowait())
+            if records:
+                self._write(records)
+
+    def log(self, route, request, response, error=None):
+        """ Enqueue the record of a request, if it is sampled. """
+        if error is None and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        if self._task is None:
+            self.start()
+        try:
+            self._queue.put_nowait((time.time(), route, request, response, error))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _write_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            records = [await self._queue.get()]
+            while len(records) < self.max_batch and not self._queue.empty():
+                records.append(self._queue.get_nowait())
+            # Shielded, so that stopping the task does not abandon the write
+            # while it still runs on the executor
+            self._writing = loop.run_in_executor(None, self._write, records)
+            await asyncio.shield(self._writing)
+
+    def _write(self, records):
+        lines = []
+        for timestamp, route, request, response, error in records:
+            record = {
+                'time': timestamp,
+                'route': route,
+                'response': response,
+            }
+            if error is not None:
+                record['error'] = error
+            line = json.dumps(record, separators=(',', ':'), default=str)
+            lines.append(line[:-1] + ',"request":' + self._payload(request) + '}')
+        self.stream.write('\n'.join(lines) + '\n')
+        self.stream.flush()
+        self.logged += len(records)
+
+    def _payload(self, payload):
+        """ Serialize a payload, as a string cut to max_payload if it is longer. """
+        data = json.dumps(payload, separators=(',', ':'), default=str)
+        if len(data) <= self.max_payload:
+            return data
+        return json.dumps(data[:self.max_payload] + '...')
+
+    def stats(self):
+        """ Return the queue depth and the counts of logged and dropped records. """
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'logged': self.logged,
+            'dropped': self.dropped,
+        }
@@ -3,8 +3,13 @@ from os import urandom
 
 from backend import ClaimsDB, Status
 from client import DynClient
+from metrics import MetricsRegistry
+from request_log import RequestLogger
 
 import json
+import sys
+import time
+import traceback
 
 routes = web.RouteTableDef()
 
@@ -12,8 +17,23 @@ class ResponseError(Exception):
     def __init__(self, status):
         self.status = status
 
+
+def finish_request(request, route, payload, response, error=None):
+    # The Status of the response, counted by the metrics middleware
+    request['dyn_status'] = response['status']
+    log_request(request, route, payload, response, error)
+
+
+def log_request(request, route, payload, response, error=None):
+    request_log = request.app['request_log']
+    if request_log is not None:
+        request_log.log(route, payload, response, error)
+    elif error is not None:
+        print(error, file=sys.stderr)
+
 @routes.post('/check')
 async def check_own_claim(request):
+    claim, error = None, None
     try:
         claim_db = request.app['db']
         claim = await request.json()
@@ -24,22 +44,54 @@ async def check_own_claim(request):
         response = {
             'status' : status.value
         }
-    except Exception as e:
-        print(e)
+    except Exception:
+        error = traceback.format_exc()
         response = {
             'status' : Status.unexpected_error.value
         }
 
-    print('\n\nRequest (/check):\n')
-    print(json.dumps(claim, indent=4))
-    print('\nResponse:\n')
-    print(json.dumps(response, indent=4))
+    finish_request(request, '/check', claim, response, error)
 
     return web.json_response(data=response)
 
+@routes.post('/check_batch')
+async def check_own_claims(request):
+    """ Check newline delimited JSON claims, and stream back one JSON status
+    per line, in the same order, as soon as each claim is checked. """
+    claim_db = request.app['db']
+    metrics = request.app['metrics']
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+
+    async for line in request.content:
+        if not line.strip():
+            continue
+
+        claim, error = None, None
+        try:
+            claim = json.loads(line)
+            status = await claim_db.check_own_claim(claim)
+            result = {
+                'status' : status.value
+            }
+        except Exception:
+            error = traceback.format_exc()
+            result = {
+                'status' : Status.unexpected_error.value
+            }
+
+        metrics.inc('dyn_http_responses_total', route='/check_batch', status=result['status'])
+        log_request(request, '/check_batch', claim, result, error)
+        await response.write((json.dumps(result) + '\n').encode('utf-8'))
+
+    await response.write_eof()
+    return response
+
 @routes.post('/generate')
 async def generate_dynamic_subaddress(request):
 
+    generation_request, error = None, None
     try:
         claim_db = request.app['db']
         generation_request = await request.json()
@@ -61,18 +113,54 @@ async def generate_dynamic_subaddress(request):
             response = {
                 'status' : e.status.value
             }
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(e)
+    except Exception:
+        error = traceback.format_exc()
         response = {
             'status' : Status.unexpected_error.value
         }
 
-    print('\n\nRequest (/generate):\n')
-    print(json.dumps(generation_request, indent=4))
-    print('\nResponse:\n')
-    print(json.dumps(response, indent=4))
+    finish_request(request, '/generate', generation_request, response, error)
+
+    return web.json_response(data=response)
+
+
+@routes.post('/generate_batch')
+async def generate_dynamic_subaddresses(request):
+
+    generation_request, error = None, None
+    try:
+        claim_db = request.app['db']
+        generation_request = await request.json()
+
+        # Check the number of subaddresses requested
+        count = generation_request.get('count')
+        if type(count) is not int or not 0 < count <= request.app['max_generate_batch']:
+            raise ResponseError(Status.invalid_batch_size)
+
+        # Check that the subaddress exists
+        subaddress = generation_request['subaddress']
+        claim = await claim_db.check_own_dynamic_subaddress(subaddress)
+        if claim is None:
+            raise ResponseError(Status.invalid_subaddress)
+
+        # Issue and return the fresh subaddresses
+        status, dyn_subaddrs = await claim_db.generate_dynamic_subaddresses(claim, count)
+        response = {
+            'status' : status.value,
+            'dynamic_subaddresses': dyn_subaddrs,
+        }
+
+    except ResponseError as e:
+            response = {
+                'status' : e.status.value
+            }
+    except Exception:
+        error = traceback.format_exc()
+        response = {
+            'status' : Status.unexpected_error.value
+        }
+
+    finish_request(request, '/generate_batch', generation_request, response, error)
 
     return web.json_response(data=response)
 
@@ -80,6 +168,7 @@ async def generate_dynamic_subaddress(request):
 @routes.post('/attest')
 async def attest(request):
 
+    attest_request, error = None, None
     try:
         claim_db = request.app['db']
         attest_request = await request.json()
@@ -88,24 +177,14 @@ async def attest(request):
         originator_claim = attest_request['originator_travel_rule_record']
         amount = attest_request['amount']
 
-        # Step 1. Check our own claim
-        status = await claim_db.check_own_claim(beneficiary_claim)
-        if status != Status.correct_record:
+        # Check both claims and the risk function, then sign a fresh reference_id
+        # (or return the one of an earlier identical request, see ClaimsDB.attest)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        status, ref_id, signature = await claim_db.attest(
+            originator_claim, beneficiary_claim, amount, idempotency_key)
+        if status != Status.compliance_signature:
             raise ResponseError(status)
 
-        # Step 2. Check the originator claim
-        status = await claim_db.client.check_other_claim(originator_claim)
-        if status != Status.correct_record:
-            raise ResponseError(Status.incorrect_originator_record)
-
-        # Step 3. Check with the risk function whether we want to attest for payment
-        risk_ok = await claim_db.call_risk_function(originator_claim, beneficiary_claim, amount)
-        if risk_ok is False:
-            raise ResponseError(Status.rejected)
-
-        # Step 4. If all good sign a fresh reference_id and return the result
-        ref_id, signature = await claim_db.generate_compliance_key_signature(originator_claim, beneficiary_claim, amount)
-
         response = {
             'status' : Status.compliance_signature.value,
             'reference_id': ref_id,
@@ -116,26 +195,89 @@ async def attest(request):
             response = {
                 'status' : e.status.value
             }
-    except Exception as e:
-        print(e)
+    except Exception:
+        error = traceback.format_exc()
         response = {
             'status' : Status.unexpected_error.value
         }
 
-    print('\n\nRequest (/attest):\n')
-    print(json.dumps(attest_request, indent=4))
-    print('\nResponse:\n')
-    print(json.dumps(response, indent=4))
+    finish_request(request, '/attest', attest_request, response, error)
 
     return web.json_response(data=response)
 
 
-async def run_service(claims_db, address='0.0.0.0', port=8080):
-    app = web.Application()
+@routes.get('/metrics')
+async def get_metrics(request):
+    return web.Response(
+        text=request.app['metrics'].render(),
+        content_type='text/plain',
+        headers={'X-Content-Type-Options': 'nosniff'},
+    )
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    code = 500
+    try:
+        response = await handler(request)
+        code = response.status
+        return response
+    except web.HTTPException as e:
+        code = e.status
+        raise
+    finally:
+        metrics = request.app['metrics']
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        metrics.observe('dyn_http_request_duration_seconds', time.perf_counter() - start, route=route)
+        metrics.inc('dyn_http_requests_total', route=route, method=request.method, code=code)
+        if 'dyn_status' in request:
+            metrics.inc('dyn_http_responses_total', route=route, status=request['dyn_status'])
+
+
+async def start_claims_db(app):
+    await app['db'].start()
+    if app['request_log'] is not None:
+        app['request_log'].start()
+
+
+async def stop_claims_db(app):
+    await app['db'].stop()
+    if app['request_log'] is not None:
+        await app['request_log'].stop()
+
+
+async def run_service(claims_db, address='0.0.0.0', port=8080, max_generate_batch=100,
+                      log_sample_rate=1.0, log_max_payload=2048, metrics=None, reuse_port=False):
+    ''' Serve the claims DB. A `log_sample_rate` fraction of requests is
+    logged to stdout (none if it is 0), with request payloads cut to
+    `log_max_payload` characters.
+
+    The counters and latency histograms of the requests, the claims DB and
+    its client are kept in `metrics` (by default, the registry of the claims
+    DB or a new one) and served on /metrics.
+
+    With reuse_port, several processes can serve the same port (see workers.py). '''
+    if metrics is None:
+        metrics = claims_db.metrics if claims_db.metrics is not None else MetricsRegistry()
+    if claims_db.metrics is None:
+        claims_db.metrics = metrics
+    if isinstance(claims_db.client, DynClient) and claims_db.client.metrics is None:
+        claims_db.client.metrics = metrics
+
+    app = web.Application(middlewares=[metrics_middleware])
     app.add_routes(routes)
     app['db'] = claims_db
+    app['metrics'] = metrics
+    app['max_generate_batch'] = max_generate_batch
+    app['request_log'] = None
+    if log_sample_rate > 0:
+        app['request_log'] = RequestLogger(sample_rate=log_sample_rate, max_payload=log_max_payload)
+    app.on_startup.append(start_claims_db)
+    app.on_cleanup.append(stop_claims_db)
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, address, port)
+    site = web.TCPSite(runner, address, port, reuse_port=reuse_port)
     await site.start()
     return runner
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import LatencyRecorder
+
+
+class SigningService:
+    """ Runs the dual attestation signing and verification of a ComplianceKey
+    in a thread or process pool, so that the LCS serialization and the
+    Ed25519 operations do not block the event loop.
+
+    Queued requests are sent to the pool in batches of up to `max_batch`,
+    with at most `max_workers` batches running at the same time. With a
+    process pool, each worker process loads its own copy of the key.
+    """
+
+    def __init__(self, compliance_key, executor='thread', max_workers=4, max_batch=32):
+        self.compliance_key = compliance_key
+        self.max_workers = max_workers
+        self.max_batch = max_batch
+
+        if executor == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='compliance-signing')
+            self._batch_key = compliance_key
+        elif executor == 'process':
+            key_data = compliance_key.export_full() if compliance_key.has_private() else compliance_key.export_pub()
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker, initargs=(key_data,))
+            self._batch_key = None
+        else:
+            raise ValueError(f'Unknown executor {executor}, expected "thread" or "process"')
+
+        self._queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._running = set()
+
+        self.latencies = LatencyRecorder()
+        self.batches = 0
+        self.requests = 0
+
+    def start(self):
+        """ Start dispatching queued requests, on the running event loop. """
+        if self._dispatcher is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch_forever())
+
+    async def stop(self):
+        """ Stop dispatching, wait for running batches and release the pool. """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+            if self._running:
+                await asyncio.wait(self._running)
+            while not self._queue.empty():
+                _, _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError('The signing service was stopped'))
+        self._executor.shutdown(wait=False)
+
+    async def sign_dual_attestation_data(self, reference_id, libra_address_bytes, amount):
+        """ See ComplianceKey.sign_dual_attestation_data """
+        return await self._submit('sign_dual_attestation_data', (reference_id, libra_address_bytes, amount))
+
+    async def verify_dual_attestation_data(self, reference_id, libra_address_bytes, amount, signature):
+        """ See ComplianceKey.verify_dual_attestation_data """
+        return await self._submit(
+            'verify_dual_attestation_data', (reference_id, libra_address_bytes, amount, signature))
+
+    async def _submit(self, operation, args):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, args, future, time.monotonic()))
+        return await future
+
+    async def _dispatch_forever(self):
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            started = time.monotonic()
+            for _, _, _, queued in batch:
+                self.latencies.record('queue_wait', started - queued)
+
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, _run_batch, self._batch_key,
+                    [(operation, args) for operation, args, _, _ in batch]
+                )
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+
+            finished = time.monotonic()
+            self.latencies.record('batch', finished - started)
+            self.batches += 1
+            self.requests += len(batch)
+
+            for (_, _, future, queued), (ok, value) in zip(batch, results):
+                self.latencies.record('total', finished - queued)
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """ Return the queue depth, batching counters and latency percentiles. """
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'running_batches': len(self._running),
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else None,
+            'latencies': self.latencies.summary(),
+        }
+
+
+# The compliance key of a worker process
+_worker_key = None
+
+
+def _init_worker(key_data):
+    global _worker_key
+    from crypto import ComplianceKey
+    _worker_key = ComplianceKey.from_str(key_data)
+
+
+def _run_batch(compliance_key, batch):
+    """ Run the (operation, args) of a batch with the compliance key (or the
+    key of the worker process), and return a list of (ok, result or exception). """
+    key = compliance_key if compliance_key is not None else _worker_key
+    results = []
+    for operation, args in batch:
+        try:
+            results.append((True, getattr(key, operation)(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ClaimsStorage:
+    """ The storage behind a ClaimsDB.
+
+    A storage exposes the maps used by ClaimsDB as attributes (`own_claim_DB`,
+    `dyn_DB`, `reference_id_DB`, `checked_claims_DB`, `claim_index_DB`,
+    `claim_counter_DB`, `dyn_expiry_DB` and `reference_expiry_DB`). Each of
+    them supports the dict operations ClaimsDB needs (`in`, `[]`, `get`,
+    `del`, `len` and iteration). The async methods of ClaimsDB access them through `run`, so
+    that a storage doing I/O can do it outside of the event loop.
+    """
+
+    async def run(self, function, *args):
+        """ Call function(*args), where the function accesses the maps. """
+        raise NotImplementedError
+
+    def transaction(self):
+        """ Return a context manager, within which reads and writes to the
+        maps are atomic, also with respect to other processes sharing the
+        storage. """
+        return nullcontext()
+
+    def flush(self):
+        """ Make all previous writes durable. """
+        pass
+
+    def close(self):
+        """ Flush and release any resources held by the storage. """
+        self.flush()
+
+
+class MemoryStorage(ClaimsStorage):
+    """ Keeps all maps in plain dicts in the memory of the process. """
+
+    def __init__(self):
+        self.own_claim_DB = {}
+        self.dyn_DB = {}
+        self.reference_id_DB = {}
+        self.checked_claims_DB = {}
+        self.claim_index_DB = {}
+        self.claim_counter_DB = {}
+        self.dyn_expiry_DB = {}
+        self.reference_expiry_DB = {}
+
+    async def run(self, function, *args):
+        return function(*args)
+
+
+class SQLiteTable(MutableMapping):
+    """ A dict-like view of an SQLite table with one value column. Keys are
+    single values or tuples (for tables with several key columns), values are
+    stored as JSON unless other encode and decode functions are given. """
+
+    def __init__(self, storage, name, key_columns, value_column, encode=json.dumps, decode=json.loads):
+        self._storage = storage
+        self._encode = encode
+        self._decode = decode
+        self._single_key = len(key_columns) == 1
+
+        keys = ', '.join(key_columns)
+        where = ' AND '.join(f'{column} = ?' for column in key_columns)
+        placeholders = ', '.join('?' for _ in range(len(key_columns) + 1))
+        self._select_sql = f'SELECT {value_column} FROM {name} WHERE {where}'
+        self._exists_sql = f'SELECT 1 FROM {name} WHERE {where}'
+        self._insert_sql = f'INSERT OR REPLACE INTO {name} ({keys}, {value_column}) VALUES ({placeholders})'
+        self._delete_sql = f'DELETE FROM {name} WHERE {where}'
+        self._count_sql = f'SELECT COUNT(*) FROM {name}'
+        self._keys_sql = f'SELECT {keys} FROM {name}'
+        self._items_sql = f'SELECT {keys}, {value_column} FROM {name}'
+
+    def _key_params(self, key):
+        return (key,) if self._single_key else tuple(key)
+
+    def _row_key(self, row):
+        return row[0] if self._single_key else tuple(row)
+
+    def __getitem__(self, key):
+        row = self._storage.fetchone(self._select_sql, self._key_params(key))
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row[0])
+
+    def __contains__(self, key):
+        return self._storage.fetchone(self._exists_sql, self._key_params(key)) is not None
+
+    def __setitem__(self, key, value):
+        self.update([(key, value)])
+
+    def __delitem__(self, key):
+        if self._storage.write(self._delete_sql, [self._key_params(key)]) == 0:
+            raise KeyError(key)
+
+    def __len__(self):
+        return self._storage.fetchone(self._count_sql)[0]
+
+    def __iter__(self):
+        return iter([self._row_key(row) for row in self._storage.fetchall(self._keys_sql)])
+
+    def items(self):
+        rows = self._storage.fetchall(self._items_sql)
+        return [(self._row_key(row[:-1]), self._decode(row[-1])) for row in rows]
+
+    def update(self, other=(), **kwargs):
+        """ Write many (key, value) pairs with a single statement. """
+        items = list(other.items() if hasattr(other, 'items') else other) + list(kwargs.items())
+        self._storage.write(
+            self._insert_sql,
+            [self._key_params(key) + (self._encode(value),) for key, value in items]
+        )
+
+
+class SQLiteStorage(ClaimsStorage):
+    """ Keeps all maps in an SQLite database file, in WAL mode.
+
+    Writes are committed in batches of `commit_batch` statements (and on
+    `flush` and `close`), so up to `commit_batch - 1` writes may be lost if
+    the process crashes. All I/O done by the async methods of ClaimsDB runs
+    on a single background thread, which also serializes access to the
+    connection.
+
+    Several processes can share the same file (see workers.py). They only
+    see each other's writes once committed, so they should use a
+    `commit_batch` of 1.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS own_claims '
+        '(unique_identifier TEXT PRIMARY KEY, claim TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS dyn_subaddresses '
+        '(subaddress BLOB PRIMARY KEY, unique_identifier TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS reference_ids '
+        '(reference_id TEXT NOT NULL, signature TEXT NOT NULL, record TEXT NOT NULL, '
+        'PRIMARY KEY (reference_id, signature))',
+        'CREATE TABLE IF NOT EXISTS checked_claims '
+        '(claim_key TEXT PRIMARY KEY, result TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS claim_indexes '
+        '(claim_index INTEGER PRIMARY KEY, unique_identifier TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS claim_counters '
+        '(unique_identifier TEXT PRIMARY KEY, state TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS dyn_expiries '
+        '(subaddress BLOB PRIMARY KEY, state TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS reference_expiries '
+        '(reference_id TEXT NOT NULL, signature TEXT NOT NULL, expires_at REAL NOT NULL, '
+        'PRIMARY KEY (reference_id, signature))',
+        # The primary key of reference_ids also serves lookups by reference_id
+        'DROP INDEX IF EXISTS reference_ids_by_reference_id',
+        'CREATE INDEX IF NOT EXISTS dyn_subaddresses_by_claim ON dyn_subaddresses (unique_identifier)',
+    ]
+
+    def __init__(self, path, commit_batch=100):
+        self.path = path
+        self.commit_batch = commit_batch
+        self._lock = threading.RLock()
+        self._pending_writes = 0
+        self._in_transaction = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='claims-sqlite')
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+            self._connection.commit()
+
+        self.own_claim_DB = SQLiteTable(self, 'own_claims', ['unique_identifier'], 'claim')
+        self.dyn_DB = SQLiteTable(
+            self, 'dyn_subaddresses', ['subaddress'], 'unique_identifier',
+            encode=str, decode=str
+        )
+        self.reference_id_DB = SQLiteTable(
+            self, 'reference_ids', ['reference_id', 'signature'], 'record',
+            decode=lambda data: tuple(json.loads(data))
+        )
+        self.checked_claims_DB = SQLiteTable(self, 'checked_claims', ['claim_key'], 'result')
+        self.claim_index_DB = SQLiteTable(
+            self, 'claim_indexes', ['claim_index'], 'unique_identifier',
+            encode=str, decode=str
+        )
+        self.claim_counter_DB = SQLiteTable(self, 'claim_counters', ['unique_identifier'], 'state')
+        self.dyn_expiry_DB = SQLiteTable(self, 'dyn_expiries', ['subaddress'], 'state')
+        self.reference_expiry_DB = SQLiteTable(
+            self, 'reference_expiries', ['reference_id', 'signature'], 'expires_at',
+            encode=float, decode=float
+        )
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def fetchone(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def write(self, sql, params_list):
+        """ Execute a write statement for each of the params, committing once
+        enough writes are pending. Returns the number of rows changed. """
+        with self._lock:
+            cursor = self._connection.executemany(sql, params_list)
+            self._pending_writes += len(params_list)
+            if self._pending_writes >= self.commit_batch and not self._in_transaction:
+                self._commit()
+            return cursor.rowcount
+
+    @contextmanager
+    def transaction(self):
+        """ Run the block atomically, as part of the pending batch of writes.
+
+        Within a pending batch the block is a savepoint, and its writes are
+        committed with the batch. Otherwise it begins the batch, taking the
+        write lock of the database file up front, so that other processes
+        cannot write between our reads and writes.
+        """
+        with self._lock:
+            savepoint = self._connection.in_transaction
+            pending_writes = self._pending_writes
+            self._connection.execute('SAVEPOINT claims_transaction' if savepoint else 'BEGIN IMMEDIATE')
+            self._in_transaction = True
+            try:
+                yield
+            except BaseException:
+                if savepoint:
+                    self._connection.execute('ROLLBACK TO claims_transaction')
+                    self._connection.execute('RELEASE claims_transaction')
+                    self._pending_writes = pending_writes
+                else:
+                    self._connection.rollback()
+                    self._pending_writes = 0
+                raise
+            else:
+                if savepoint:
+                    self._connection.execute('RELEASE claims_transaction')
+                if self._pending_writes >= self.commit_batch:
+                    self._commit()
+            finally:
+                self._in_transaction = False
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending_writes = 0
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,68 @@
+from hashlib import blake2b
+
+
+class SubaddressCipher:
+    """ A keyed pseudorandom permutation over 8 byte subaddresses.
+
+    Stateless dynamic subaddresses are the encryption of a (claim index,
+    counter) pair under a per-VASP secret key, so that the VASP can recover
+    the claim of a subaddress by decrypting it, while to anyone else the
+    subaddresses of a claim look random and unlinkable.
+
+    The block cipher is a balanced Feistel network over two 32 bit halves,
+    with keyed BLAKE2b as the round function. A 64 bit block holds a 24 bit
+    claim index, a 24 bit counter and 16 zero bits, which are checked when
+    decrypting so that arbitrary subaddresses are rejected (except with
+    probability 2^-16).
+    """
+
+    INDEX_BITS = 24
+    COUNTER_BITS = 24
+    TAG_BITS = 16
+    MAX_CLAIMS = 1 << INDEX_BITS
+    MAX_COUNTER = 1 << COUNTER_BITS
+
+    def __init__(self, key, rounds=6):
+        if not 16 <= len(key) <= 64:
+            raise ValueError('The subaddress key should be between 16 and 64 bytes')
+        self._key = bytes(key)
+        self._rounds = rounds
+
+    def _round(self, number, half):
+        data = bytes([number]) + half.to_bytes(4, 'big')
+        return int.from_bytes(blake2b(data, key=self._key, digest_size=4).digest(), 'big')
+
+    def encrypt(self, block):
+        """ Encrypt an 8 byte block. """
+        left, right = int.from_bytes(block[:4], 'big'), int.from_bytes(block[4:], 'big')
+        for number in range(self._rounds):
+            left, right = right, left ^ self._round(number, right)
+        return left.to_bytes(4, 'big') + right.to_bytes(4, 'big')
+
+    def decrypt(self, block):
+        """ Decrypt an 8 byte block. """
+        left, right = int.from_bytes(block[:4], 'big'), int.from_bytes(block[4:], 'big')
+        for number in reversed(range(self._rounds)):
+            left, right = right ^ self._round(number, left), left
+        return left.to_bytes(4, 'big') + right.to_bytes(4, 'big')
+
+    def encode(self, claim_index, counter):
+        """ Return the subaddress bytes for the counter-th subaddress of a claim.
+        A claim has at most 2^24 subaddresses. """
+        if not 0 <= claim_index < self.MAX_CLAIMS:
+            raise ValueError(f'Claim index should be below {self.MAX_CLAIMS}, got {claim_index}')
+        if not 0 <= counter < self.MAX_COUNTER:
+            raise ValueError(f'Counter should be below {self.MAX_COUNTER}, got {counter}')
+        value = ((claim_index << self.COUNTER_BITS) | counter) << self.TAG_BITS
+        return self.encrypt(value.to_bytes(8, 'big'))
+
+    def decode(self, subaddress_bytes):
+        """ Return the (claim index, counter) of subaddress bytes produced by
+        `encode`, or None for any other subaddress. """
+        if len(subaddress_bytes) != 8:
+            return None
+        value = int.from_bytes(self.decrypt(subaddress_bytes), 'big')
+        if value & ((1 << self.TAG_BITS) - 1):
+            return None
+        value >>= self.TAG_BITS
+        return (value >> self.COUNTER_BITS, value & ((1 << self.COUNTER_BITS) - 1))
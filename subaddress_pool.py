@@ -0,0 +1,106 @@
+import asyncio
+import traceback
+from collections import deque
+from os import urandom
+
+
+class SubaddressPool:
+    """ A pool of fresh, already encoded random subaddresses of a ClaimsDB.
+
+    Subaddresses in the pool are not in the dyn_DB of the ClaimsDB, and are
+    handed out only once. When a `take` leaves fewer than `low_water`
+    subaddresses in the pool, a background task refills it up to `size`, in
+    batches of `refill_batch`.
+    """
+
+    def __init__(self, claims_db, size, low_water=None, refill_batch=None):
+        self.claims_db = claims_db
+        self.size = size
+        self.low_water = low_water if low_water is not None else size // 2
+        self.refill_batch = refill_batch if refill_batch is not None else max(1, size // 4)
+
+        self._pool = deque()
+        self._reserved = set()
+        self._wanted = None
+        self._task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+
+    def start(self):
+        """ Start the background refill task, on the running event loop. """
+        if self._task is None:
+            self._wanted = asyncio.Event()
+            self._wanted.set()
+            self._task = asyncio.get_running_loop().create_task(self._refill_forever())
+
+    async def stop(self):
+        """ Stop the background refill task. """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take(self, count):
+        """ Remove up to count subaddresses from the pool, and return them as
+        a list of (subaddress bytes, encoded subaddress) pairs. """
+        if count < 0:
+            raise ValueError(f'Cannot take {count} subaddresses')
+        taken = []
+        while self._pool and len(taken) < count:
+            entry = self._pool.popleft()
+            self._reserved.discard(entry[0])
+            taken.append(entry)
+
+        self.hits += len(taken)
+        self.misses += count - len(taken)
+        if len(self._pool) < self.low_water:
+            if self._task is None:
+                self.start()
+            self._wanted.set()
+        return taken
+
+    async def refill(self):
+        """ Fill the pool up to its size. """
+        claims_db = self.claims_db
+        while len(self._pool) < self.size:
+            wanted = min(self.refill_batch, self.size - len(self._pool))
+            candidates = {urandom(8) for _ in range(wanted)} - self._reserved
+            unused = await claims_db.storage.run(_unused_keys, claims_db.dyn_DB, candidates)
+            unused = [subaddress for subaddress in unused if subaddress not in self._reserved]
+
+            encoded = claims_db.subaddress_template.encode_many(unused)
+            self._pool.extend(zip(unused, encoded))
+            self._reserved.update(unused)
+            self.refills += 1
+
+    async def _refill_forever(self):
+        while True:
+            await self._wanted.wait()
+            self._wanted.clear()
+            try:
+                await self.refill()
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        """ Return the configuration, current size and counters of the pool. """
+        requests = self.hits + self.misses
+        return {
+            'size': self.size,
+            'low_water': self.low_water,
+            'refill_batch': self.refill_batch,
+            'available': len(self._pool),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else None,
+            'refills': self.refills,
+        }
+
+
+def _unused_keys(table, keys):
+    return [key for key in keys if key not in table]
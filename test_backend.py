@@ -0,0 +1,419 @@
+import asyncio
+from os import urandom
+
+import pytest
+from backend import ClaimsDB, Status
+from example_claims import example_claim
+from client import DynClient
+from libra_address import LibraAddress
+from subaddress_cipher import SubaddressCipher
+
+
+def fixture_claims_db():
+    vasp_bytes = urandom(16)
+    cdb = ClaimsDB(LibraAddress.from_bytes(vasp_bytes).as_str())
+    claim = cdb.add_own_claim(example_claim(vasp_bytes))
+    return vasp_bytes, cdb, claim
+
+
+@pytest.mark.asyncio
+async def test_dyn_db_references_claims():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    status, dynamic_subaddress = await cdb.generate_dynamic_subaddress(claim)
+    assert status == Status.fresh_dynamic_subaddress
+
+    subaddress_bytes = LibraAddress.from_encoded_str(dynamic_subaddress).subaddress_bytes
+    assert cdb.dyn_DB[subaddress_bytes] == claim['unique_identifier']
+
+    view = await cdb.check_own_dynamic_subaddress(dynamic_subaddress)
+    assert view == claim
+    with pytest.raises(TypeError):
+        view['legal_name'] = 'Other Name'
+    with pytest.raises(TypeError):
+        view['originator_data']['identity']['passport_number'] = '0'
+
+    # The view is frozen once, not on every lookup
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) is view
+
+
+@pytest.mark.asyncio
+async def test_claim_views_freeze_lists():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage)
+    cdb.own_claim_DB[claim['unique_identifier']] = dict(claim, nationalities=['FR', {'other': ['GB']}])
+    view = await cdb.check_own_dynamic_subaddress(claim['long_term_subaddress'])
+    assert view['nationalities'] == ('FR', {'other': ('GB',)})
+    with pytest.raises(TypeError):
+        view['nationalities'][1]['other'] = ()
+
+
+@pytest.mark.asyncio
+async def test_unknown_subaddresses_are_not_resolved():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    other_vasp = LibraAddress.from_bytes(urandom(16), urandom(8)).as_str()
+    assert await cdb.check_own_dynamic_subaddress(other_vasp) is None
+    assert await cdb.check_own_dynamic_subaddress(LibraAddress.from_bytes(vasp_bytes, urandom(8)).as_str()) is None
+    assert await cdb.check_own_dynamic_subaddress('not an address') is None
+
+    with pytest.raises(Exception):
+        cdb.add_own_claim(dict(claim, long_term_subaddress=other_vasp))
+
+
+@pytest.mark.asyncio
+async def test_derived_subaddresses_resolve_without_storage():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    _, random_subaddress = await cdb.generate_dynamic_subaddress(claim)
+
+    # Enable derived subaddresses on the same storage
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, subaddress_key=urandom(32))
+    dyn_size = len(cdb.dyn_DB)
+    derived = [(await cdb.generate_dynamic_subaddress(claim))[1] for _ in range(20)]
+    assert len(set(derived)) == 20
+    assert len(cdb.dyn_DB) == dyn_size
+
+    for subaddress in derived + [random_subaddress, claim['long_term_subaddress']]:
+        assert await cdb.check_own_dynamic_subaddress(subaddress) == claim
+
+    # Subaddresses that were not issued are not resolved
+    next_subaddress = cdb.subaddress_template.encode(cdb.subaddress_cipher.encode(0, 20))
+    assert await cdb.check_own_dynamic_subaddress(next_subaddress) is None
+    assert await cdb.check_own_dynamic_subaddress(LibraAddress.from_bytes(vasp_bytes, urandom(8)).as_str()) is None
+
+
+@pytest.mark.asyncio
+async def test_derived_subaddresses_do_not_wrap_around():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, subaddress_key=urandom(32))
+    await cdb.generate_dynamic_subaddress(claim)
+    last_counter = SubaddressCipher.MAX_COUNTER - 1
+    cdb.claim_counter_DB[claim['unique_identifier']] = [0, last_counter]
+
+    # A batch that does not fit is refused as a whole
+    with pytest.raises(ValueError):
+        await cdb.generate_dynamic_subaddresses(claim, 2)
+    status, subaddress = await cdb.generate_dynamic_subaddress(claim)
+    assert status == Status.fresh_dynamic_subaddress
+    assert cdb.subaddress_cipher.decode(LibraAddress.from_encoded_str(subaddress).subaddress_bytes) == (0, last_counter)
+    with pytest.raises(ValueError):
+        await cdb.generate_dynamic_subaddress(claim)
+    assert cdb.claim_counter_DB[claim['unique_identifier']] == [0, SubaddressCipher.MAX_COUNTER]
+
+
+@pytest.mark.asyncio
+async def test_negative_subaddress_count_is_refused():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    derived = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, subaddress_key=urandom(32))
+    for claims_db in (cdb, derived):
+        with pytest.raises(ValueError):
+            await claims_db.generate_dynamic_subaddresses(claim, -1)
+    assert (await cdb.generate_dynamic_subaddresses(claim, 0)) == (Status.fresh_dynamic_subaddress, [])
+    with pytest.raises(ValueError):
+        derived._next_derived_subaddresses(claim['unique_identifier'], -1)
+
+    pool = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, pool_size=8).subaddress_pool
+    with pytest.raises(ValueError):
+        pool.take(-1)
+
+
+def test_subaddress_cipher_is_a_permutation():
+    cipher = SubaddressCipher(urandom(32))
+    for _ in range(100):
+        block = urandom(8)
+        assert cipher.decrypt(cipher.encrypt(block)) == block
+    assert cipher.decode(cipher.encode(12345, 678)) == (12345, 678)
+    assert cipher.decode(urandom(4)) is None
+    with pytest.raises(ValueError):
+        cipher.encode(0, SubaddressCipher.MAX_COUNTER)
+
+
+@pytest.mark.asyncio
+async def test_subaddress_pool_refills_in_background():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, pool_size=8, pool_low_water=4, pool_refill_batch=4)
+    await cdb.start()
+    await asyncio.sleep(0.01)
+    assert cdb.subaddress_pool.stats()['available'] == 8
+
+    status, subaddresses = await cdb.generate_dynamic_subaddresses(claim, 6)
+    assert status == Status.fresh_dynamic_subaddress
+    assert len(set(subaddresses)) == 6
+    for subaddress in subaddresses:
+        assert await cdb.check_own_dynamic_subaddress(subaddress) == claim
+
+    # Two were left, refilled up to 8 again
+    await asyncio.sleep(0.01)
+    stats = cdb.subaddress_pool.stats()
+    assert stats['hits'] == 6
+    assert stats['misses'] == 0
+    assert stats['available'] == 8
+
+    _, subaddresses = await cdb.generate_dynamic_subaddresses(claim, 10)
+    assert len(set(subaddresses)) == 10
+    assert cdb.subaddress_pool.stats()['misses'] == 2
+    await cdb.stop()
+
+
+class FakeComplianceKey:
+    def sign_dual_attestation_data(self, reference_id, libra_address_bytes, amount):
+        return b'signature'
+
+
+class FakeClient:
+    def __init__(self, status=Status.correct_record, delay=0.0):
+        self.status = status
+        self.delay = delay
+
+    async def check_other_claim(self, claim):
+        await asyncio.sleep(self.delay)
+        return self.status
+
+    async def close(self):
+        pass
+
+
+def fixture_attest_db(client, **kwargs):
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, client=client,
+                   compliance_key=FakeComplianceKey(), **kwargs)
+    originator_claim = {'vasp_libra_address': LibraAddress.from_bytes(urandom(16)).as_str()}
+    return cdb, claim, originator_claim
+
+
+@pytest.mark.asyncio
+async def test_attest_pipeline_records_step_timings():
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(delay=0.01))
+    status, reference_id, signature = await cdb.attest(originator_claim, claim, 1000)
+    assert status == Status.compliance_signature
+    assert signature == b'signature'.hex()
+
+    timings = cdb.attest_timings.summary()
+    for step in ['check_beneficiary', 'check_originator', 'risk', 'sign', 'total']:
+        assert timings[step]['count'] == 1
+    assert timings['check_originator']['max'] >= 0.01
+
+
+@pytest.mark.asyncio
+async def test_attest_pipeline_stops_at_first_failure():
+    # The slow remote check is cancelled when our own claim is incorrect
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(delay=10))
+    wrong_claim = dict(claim, legal_name='Other Name')
+    status, _, _ = await asyncio.wait_for(cdb.attest(originator_claim, wrong_claim, 1000), 1)
+    assert status == Status.incorrect_record
+
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(status=Status.incorrect_record))
+    status, _, _ = await cdb.attest(originator_claim, claim, 1000)
+    assert status == Status.incorrect_originator_record
+
+
+class SlowDynClient(DynClient):
+    async def _check_other_claim(self, claim):
+        await asyncio.sleep(0.05)
+        return Status.correct_record
+
+
+@pytest.mark.asyncio
+async def test_rejected_attest_does_not_cancel_shared_check():
+    # Both attests share the cached check of the originator claim, started by
+    # the rejected one, which stops waiting for it first
+    client = SlowDynClient()
+    cdb, claim, originator_claim = fixture_attest_db(client)
+    originator_claim['verification_endpoint'] = 'http://localhost:8080'
+
+    async def risk(originator_claim, beneficiary_claim, amount):
+        return amount < 5000
+
+    cdb.call_risk_function = risk
+    results = await asyncio.gather(
+        cdb.attest(originator_claim, claim, 9000), cdb.attest(originator_claim, claim, 1000),
+        return_exceptions=True)
+    assert results[0] == (Status.rejected, None, None)
+    assert results[1][0] == Status.compliance_signature
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_attest_pipeline_deadline():
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(delay=10), attest_deadline=0.05)
+    status, _, _ = await cdb.attest(originator_claim, claim, 1000)
+    assert status == Status.deadline_exceeded
+    assert len(cdb.reference_id_DB) == 0
+
+
+@pytest.mark.asyncio
+async def test_check_own_claim_statuses():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    unique_id = claim['unique_identifier']
+    endpoint = claim['verification_endpoint']
+
+    def partial(**fields):
+        return dict(fields, unique_identifier=unique_id, verification_endpoint=endpoint)
+
+    assert await cdb.check_own_claim(claim) == Status.correct_record
+    assert await cdb.check_own_claim(partial(legal_name='Adam Smith')) == Status.correct_record
+    assert await cdb.check_own_claim(partial(legal_name='Eve')) == Status.incorrect_record
+    assert await cdb.check_own_claim(partial(nickname='Adam')) == Status.unexpected_data
+    assert await cdb.check_own_claim(partial(legal_name=['Adam'])) == Status.unexpected_data
+    assert await cdb.check_own_claim(partial(originator_data='x')) == Status.incorrect_record
+    assert await cdb.check_own_claim(partial(
+        originator_data={'identity': {'passport_number': '77tjjjr774'}})) == Status.correct_record
+    assert await cdb.check_own_claim(partial(
+        originator_data={'identity': {'passport_number': '0'}})) == Status.incorrect_record
+    assert await cdb.check_own_claim(partial(
+        originator_data={'identity': {'passport': '0'}})) == Status.unexpected_data
+    assert await cdb.check_own_claim(dict(claim, unique_identifier='0' * 64)) == Status.missing_identifier
+    assert await cdb.check_own_claim({'unique_identifier': unique_id}) == Status.incorrect_record
+
+    # Top level fields are checked before nested ones, and the first failure is returned
+    assert await cdb.check_own_claim(partial(
+        originator_data={'identity': {'passport': '0'}}, legal_name='Eve')) == Status.incorrect_record
+
+
+@pytest.mark.asyncio
+async def test_check_own_claim_compiles_stored_claims():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage)
+    assert len(cdb.compiled_claims) == 0
+    assert await cdb.check_own_claim(claim) == Status.correct_record
+    assert cdb.compiled_claims.get(claim['unique_identifier']) is not None
+
+
+@pytest.mark.asyncio
+async def test_claim_caches_are_bounded():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, claim_cache_size=1)
+    other_claim = cdb.add_own_claim(dict(
+        claim, long_term_subaddress=LibraAddress.from_bytes(vasp_bytes, urandom(8)).as_str()))
+    assert await cdb.check_own_claim(claim) == Status.correct_record
+    assert await cdb.check_own_claim(other_claim) == Status.correct_record
+    assert await cdb.check_own_claim(dict(claim, legal_name='Eve')) == Status.incorrect_record
+    assert len(cdb.compiled_claims) == 1
+
+    assert await cdb.check_own_dynamic_subaddress(claim['long_term_subaddress']) == claim
+    assert await cdb.check_own_dynamic_subaddress(other_claim['long_term_subaddress']) == other_claim
+    assert len(cdb.frozen_claims) == 1
+
+
+@pytest.mark.asyncio
+async def test_attest_is_idempotent():
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(delay=0.01))
+    results = await asyncio.gather(*[cdb.attest(originator_claim, claim, 1000) for _ in range(5)])
+    assert results[0][0] == Status.compliance_signature
+    assert results == [results[0]] * 5
+    assert await cdb.attest(originator_claim, claim, 1000) == results[0]
+    assert len(cdb.reference_id_DB) == 1
+    assert cdb.attest_timings.summary()['total']['count'] == 1
+
+    # Another amount is another attestation
+    other = await cdb.attest(originator_claim, claim, 2000)
+    assert other[0] == Status.compliance_signature
+    assert other[1] != results[0][1]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_attest_does_not_cancel_duplicate():
+    # The first request goes away (e.g. its client disconnects) while a
+    # duplicate waits for the same attestation
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(delay=0.05))
+    first = asyncio.ensure_future(cdb.attest(originator_claim, claim, 1000))
+    await asyncio.sleep(0)
+    duplicate = asyncio.ensure_future(cdb.attest(originator_claim, claim, 1000))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    status, reference_id, _ = await duplicate
+    assert status == Status.compliance_signature
+    assert first.cancelled()
+    assert (await cdb.attest(originator_claim, claim, 1000))[1] == reference_id
+    assert len(cdb.reference_id_DB) == 1
+
+
+@pytest.mark.asyncio
+async def test_attest_idempotency_key():
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient())
+    result = await cdb.attest(originator_claim, claim, 1000, idempotency_key='payment-1')
+    assert await cdb.attest(originator_claim, claim, 1000, idempotency_key='payment-1') == result
+    status, _, _ = await cdb.attest(originator_claim, claim, 2000, idempotency_key='payment-1')
+    assert status == Status.unexpected_data
+    other = await cdb.attest(originator_claim, claim, 1000, idempotency_key='payment-2')
+    assert other[1] != result[1]
+
+
+@pytest.mark.asyncio
+async def test_attest_failures_are_not_remembered():
+    client = FakeClient(status=Status.incorrect_record)
+    cdb, claim, originator_claim = fixture_attest_db(client)
+    status, _, _ = await cdb.attest(originator_claim, claim, 1000)
+    assert status == Status.incorrect_originator_record
+
+    client.status = Status.correct_record
+    status, _, _ = await cdb.attest(originator_claim, claim, 1000)
+    assert status == Status.compliance_signature
+
+    cdb, claim, originator_claim = fixture_attest_db(FakeClient(), attest_idempotency_window=0)
+    first = await cdb.attest(originator_claim, claim, 1000)
+    second = await cdb.attest(originator_claim, claim, 1000)
+    assert first[1] != second[1]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_dynamic_subaddresses_expire():
+    clock = FakeClock()
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, subaddress_ttl=60, clock=clock)
+
+    _, early = await cdb.generate_dynamic_subaddresses(claim, 3)
+    clock.now += 30
+    _, late = await cdb.generate_dynamic_subaddress(claim)
+    clock.now += 40
+
+    # Expired subaddresses are not resolved, even before they are purged
+    assert await cdb.check_own_dynamic_subaddress(early[0]) is None
+    assert await cdb.check_own_dynamic_subaddress(late) == claim
+    assert await cdb.check_own_dynamic_subaddress(claim['long_term_subaddress']) == claim
+
+    assert await cdb.purge_expired() == 2
+    assert len(cdb.dyn_DB) == 2
+    assert len(cdb.dyn_expiry_DB) == 1
+    assert len(cdb.subaddress_expiries) == 1
+
+    clock.now += 30
+    assert await cdb.purge_expired() == 1
+    assert await cdb.check_own_dynamic_subaddress(late) is None
+    assert list(cdb.dyn_DB.values()) == [claim['unique_identifier']]
+
+
+@pytest.mark.asyncio
+async def test_dynamic_subaddresses_expire_after_uses():
+    vasp_bytes, cdb, claim = fixture_claims_db()
+    cdb = ClaimsDB(cdb.own_VASP_address, storage=cdb.storage, subaddress_max_uses=2)
+    _, dynamic_subaddress = await cdb.generate_dynamic_subaddress(claim)
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) == claim
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) == claim
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) is None
+    assert len(cdb.dyn_expiry_DB) == 0
+
+    with pytest.raises(ValueError):
+        ClaimsDB(cdb.own_VASP_address, subaddress_key=urandom(32), subaddress_ttl=60)
+
+
+@pytest.mark.asyncio
+async def test_attestation_records_expire():
+    clock = FakeClock()
+    cdb, claim, originator_claim = fixture_attest_db(
+        FakeClient(), attestation_retention=3600, attest_idempotency_window=0, clock=clock)
+    await cdb.attest(originator_claim, claim, 1000)
+    clock.now += 1800
+    _, reference_id, signature = await cdb.attest(originator_claim, claim, 2000)
+
+    clock.now += 1800
+    assert await cdb.purge_expired() == 1
+    assert list(cdb.reference_id_DB) == [(reference_id, signature)]
+    assert list(cdb.reference_expiry_DB) == [(reference_id, signature)]
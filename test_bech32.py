@@ -0,0 +1,80 @@
+from os import urandom
+
+import pytest
+from bech32 import (
+    bech32_address_encode,
+    bech32_address_decode,
+    bech32_address_encode_batch,
+    bech32_address_decode_batch,
+    Bech32Error,
+    LBR,
+    TLB,
+)
+
+
+def test_known_vectors():
+    address_bytes = bytes.fromhex('f72589b71ff4f8d139674a3f7369c69b')
+    subaddress_bytes = bytes.fromhex('cf64428bdeb62af2')
+    vectors = [
+        (LBR, subaddress_bytes, 'lbr1p7ujcndcl7nudzwt8fglhx6wxn08kgs5tm6mz4usw5p72t'),
+        (TLB, None, 'tlb1p7ujcndcl7nudzwt8fglhx6wxnvqqqqqqqqqqqqqmrn87g'),
+    ]
+    for hrp, sub, encoded in vectors:
+        assert bech32_address_encode(hrp, address_bytes, sub) == encoded
+        _, version, decoded_address, decoded_sub = bech32_address_decode(encoded)
+        assert version == 1
+        assert decoded_address == address_bytes
+        assert decoded_sub == (sub or b'\0' * 8)
+
+    # A single changed character must fail the checksum
+    with pytest.raises(Bech32Error):
+        bech32_address_decode(vectors[0][2][:-1] + 'q')
+
+
+def test_encode_batch_matches_scalar():
+    pairs = [(urandom(16), urandom(8)) for _ in range(50)]
+    pairs += [(urandom(16), None), (urandom(15), None), (urandom(16), urandom(4))]
+
+    for hrp in [LBR, TLB]:
+        results, errors = bech32_address_encode_batch(hrp, pairs)
+        assert len(results) == len(errors) == len(pairs)
+        for (address_bytes, subaddress_bytes), result, error in zip(pairs, results, errors):
+            try:
+                assert result == bech32_address_encode(hrp, address_bytes, subaddress_bytes)
+                assert error is None
+            except Bech32Error as e:
+                assert result is None
+                assert str(error) == str(e)
+
+
+def test_encode_batch_reports_per_item_errors():
+    address_bytes = urandom(16)
+    pairs = [(address_bytes, None), ('not bytes', None), (address_bytes, 8), None, (address_bytes, None)]
+    results, errors = bech32_address_encode_batch(LBR, pairs)
+    assert results[0] == results[4] == bech32_address_encode(LBR, address_bytes, None)
+    assert results[1:4] == [None, None, None]
+    assert errors[0] is errors[4] is None
+    assert all(isinstance(error, Bech32Error) for error in errors[1:4])
+
+
+def test_decode_batch_matches_scalar():
+    addresses, _ = bech32_address_encode_batch(LBR, [(urandom(16), urandom(8)) for _ in range(20)])
+    addresses += [addresses[0].upper(), addresses[1][:-1] + 'q', addresses[2][:-1], 'tlb1' + 'x' * 46]
+
+    for expected_hrp in [None, LBR, TLB]:
+        results, errors = bech32_address_decode_batch(addresses, expected_hrp)
+        for address, result, error in zip(addresses, results, errors):
+            try:
+                assert result == bech32_address_decode(address, expected_hrp)
+                assert error is None
+            except Bech32Error as e:
+                assert result is None
+                assert str(error) == str(e)
+
+
+def test_decode_batch_reports_per_item_errors():
+    good = bech32_address_encode(LBR, urandom(16), urandom(8))
+    results, errors = bech32_address_decode_batch([good, good[:-1], good])
+    assert results[0] == results[2] == bech32_address_decode(good)
+    assert results[1] is None
+    assert isinstance(errors[1], Bech32Error)
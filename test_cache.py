@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from cache import TTLCache, canonical_digest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_canonical_digest_ignores_key_order():
+    assert canonical_digest({'a': 1, 'b': {'c': 2, 'd': 3}}) == canonical_digest({'b': {'d': 3, 'c': 2}, 'a': 1})
+    assert canonical_digest({'a': 1}, 'x') != canonical_digest({'a': 1}, 'y')
+
+
+def test_entries_expire_and_are_evicted():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, negative_ttl=1, is_negative=lambda value: value is False, clock=clock)
+    cache.put('good', True)
+    cache.put('bad', False)
+
+    clock.now = 2
+    assert cache.get('good') is True
+    assert cache.get('bad') is None
+
+    cache.put('other', True)
+    cache.put('another', True)
+    assert cache.get('good') is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['expirations'] == 1
+
+    clock.now = 20
+    assert cache.get('other') is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_computations_are_coalesced():
+    cache = TTLCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    results = await asyncio.gather(*[cache.get_or_compute('key', compute) for _ in range(10)])
+    assert results == ['value'] * 10
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 9
+    assert await cache.get_or_compute('key', compute) == 'value'
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_computation():
+    cache = TTLCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    first = asyncio.ensure_future(cache.get_or_compute('key', compute))
+    second = asyncio.ensure_future(cache.get_or_compute('key', compute))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 'value'
+    assert first.cancelled()
+    assert len(calls) == 1
+    assert cache.get('key') == 'value'
+
+
+@pytest.mark.asyncio
+async def test_exceptions_are_not_cached():
+    cache = TTLCache()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    results = await asyncio.gather(*[cache.get_or_compute('key', fail) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(cache) == 0
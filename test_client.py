@@ -0,0 +1,102 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from client import DynClient
+
+
+@pytest.mark.asyncio
+async def test_bindings_are_cached_and_coalesced():
+    calls = []
+
+    async def checker(libra_address, url):
+        calls.append((libra_address, url))
+        await asyncio.sleep(0.01)
+        return url.startswith('https://')
+
+    client = DynClient(custom_checker=checker)
+    bindings = [('lbr1a', 'https://a.example'), ('lbr1b', 'http://b.example')] * 5
+    results = await client.check_bindings(bindings)
+    assert results == [True, False] * 5
+    assert len(calls) == 2
+
+    assert await client.check_binding('lbr1a', 'https://a.example')
+    assert len(calls) == 2
+
+    client.invalidate_binding(libra_address='lbr1a')
+    assert await client.check_binding('lbr1a', 'https://a.example')
+    assert await client.check_binding('lbr1b', 'http://b.example') is False
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_binding_cache_can_be_disabled():
+    calls = []
+
+    async def checker(libra_address, url):
+        calls.append((libra_address, url))
+        return True
+
+    client = DynClient(custom_checker=checker, binding_cache_ttl=0, binding_cache_negative_ttl=0)
+    await client.check_bindings([('lbr1a', 'https://a.example')] * 3)
+    assert len(calls) == 3
+
+
+async def run_check_batch_stub(port, results, status=200):
+    """ Serve /check_batch with a fixed number of results, whatever the claims. """
+    async def check_batch(request):
+        await request.read()
+        response = web.StreamResponse(status=status)
+        await response.prepare(request)
+        for _ in range(results):
+            await response.write(b'{"status": "correct_record"}\n')
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post('/check_batch', check_batch)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, 'localhost', port).start()
+    return runner
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('results, status, error', [
+    (3, 200, aiohttp.ClientPayloadError),
+    (1, 200, aiohttp.ClientPayloadError),
+    (0, 500, aiohttp.ClientResponseError),
+])
+async def test_check_other_claims_rejects_mismatched_responses(results, status, error):
+    port = 8095
+    runner = await run_check_batch_stub(port, results, status)
+
+    async def claims():
+        for _ in range(2):
+            yield {'vasp_libra_address': 'lbr1a', 'legal_name': 'Adam Smith'}
+
+    try:
+        async with DynClient() as client:
+            with pytest.raises(error):
+                async for _ in client.check_other_claims(f'http://localhost:{port}', claims()):
+                    pass
+    finally:
+        await runner.cleanup()
+
+
+def test_session_of_a_previous_loop_is_closed():
+    client = DynClient()
+
+    async def session():
+        session = client.session()
+        await asyncio.sleep(0)
+        return session
+
+    first = asyncio.run(session())
+    connector = first.connector
+    second = asyncio.run(session())
+    assert second is not first
+    assert first.closed
+    assert connector.closed
+    asyncio.run(client.close())
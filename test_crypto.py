@@ -0,0 +1,70 @@
+import pytest
+from jwcrypto import jws
+
+from crypto import ComplianceKey, OffChainInvalidSignature
+
+
+@pytest.mark.asyncio
+async def test_sign_message_matches_jws():
+    key = ComplianceKey.generate()
+    signature = await key.sign_message('{"hello": "world"}')
+    assert signature.startswith('.')
+
+    verifier = jws.JWS()
+    verifier.deserialize(signature)
+    verifier.verify(key._key, alg='EdDSA')
+    assert verifier.payload == b'{"hello": "world"}'
+    assert await key.verify_message(signature) == '{"hello": "world"}'
+
+
+@pytest.mark.asyncio
+async def test_verify_message_with_alg_header():
+    key = ComplianceKey.generate()
+    signer = jws.JWS(b'payload')
+    signer.add_signature(key._key, alg='EdDSA', protected={'alg': 'EdDSA'})
+    signature = signer.serialize(compact=True)
+
+    public_key = ComplianceKey.from_pub_bytes(key.get_public().public_bytes_raw())
+    assert await public_key.verify_message(signature) == 'payload'
+
+
+@pytest.mark.asyncio
+async def test_verify_message_invalid():
+    key = ComplianceKey.generate()
+    signature = await key.sign_message('payload')
+    other_signature = await ComplianceKey.generate().sign_message('payload')
+
+    with pytest.raises(OffChainInvalidSignature):
+        await key.verify_message(other_signature)
+    with pytest.raises(OffChainInvalidSignature):
+        await key.verify_message(signature[:-4] + 'AAAA')
+    with pytest.raises(OffChainInvalidSignature):
+        await key.verify_message('.@@.@@')
+    with pytest.raises(OffChainInvalidSignature):
+        await key.verify_message('not a signature')
+
+
+def test_key_objects_are_kept():
+    key = ComplianceKey.generate()
+    assert key.get_private() is key.get_private()
+    assert key.get_public() is key.get_public()
+
+
+@pytest.mark.parametrize('executor', [None, 'thread', 'process'])
+def test_verify_dual_attestation_batch(executor):
+    key = ComplianceKey.generate()
+    address = bytes(range(16))
+    items = []
+    for i in range(10):
+        signature = key.sign_dual_attestation_data(f'ref{i}', address, i)
+        items.append((f'ref{i}', address, i, signature))
+    # Wrong amount, wrong signature
+    items[3] = ('ref3', address, 4, items[3][3])
+    items[7] = ('ref7', address, 7, b'\0' * 64)
+
+    public_key = ComplianceKey.from_pub_bytes(key.get_public().public_bytes_raw())
+    results = public_key.verify_dual_attestation_batch(items, executor=executor, chunk_size=3)
+    assert len(results) == 10
+    assert [i for i, result in enumerate(results) if result is not None] == [3, 7]
+    assert isinstance(results[3], OffChainInvalidSignature)
+    assert isinstance(results[7], OffChainInvalidSignature)
@@ -1,3 +1,5 @@
+import asyncio
+import aiohttp
 from service import *
 
 import pytest
@@ -260,3 +262,141 @@ async def test_run_service_attest_bad_originator():
 
     await runner.cleanup()
     await runner2.cleanup()
+
+@pytest.mark.asyncio
+async def test_run_service_generate_batch():
+    port=8089
+    vasp_address, vasp_subaddress, originator_claim, beneficiary_claim = fixture_example_claim(port)
+
+    cdb = ClaimsDB(vasp_address)
+    runner = await run_service(cdb, port=port, max_generate_batch=10)
+
+    claim = cdb.add_own_claim(originator_claim)
+
+    client = DynClient()
+    url = f'http://localhost:{port}'
+
+    status, dynamic_subaddresses = await client.get_subaddresses_from_subaddress(url, vasp_subaddress, 10)
+    assert status == Status.fresh_dynamic_subaddress
+    assert len(set(dynamic_subaddresses)) == 10
+    for dynamic_subaddress in dynamic_subaddresses:
+        assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) == claim
+
+    status, dynamic_subaddresses = await client.get_subaddresses_from_subaddress(url, vasp_subaddress, 11)
+    assert status == Status.invalid_batch_size
+    assert dynamic_subaddresses is None
+
+    # A request without a count is an invalid batch size too
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f'{url}/generate_batch', json={'subaddress': vasp_subaddress}) as resp:
+            assert (await resp.json())['status'] == Status.invalid_batch_size.value
+
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_client_reuses_connections():
+    port=8090
+    vasp_address, vasp_subaddress, originator_claim, beneficiary_claim = fixture_example_claim(port)
+
+    cdb = ClaimsDB(vasp_address)
+    runner = await run_service(cdb, port=port)
+
+    claim = cdb.add_own_claim(originator_claim)
+
+    async with DynClient(limit_per_host=1) as client:
+        session = client.session()
+        for _ in range(5):
+            status = await client.check_other_claim(claim)
+            assert status == Status.correct_record
+            assert client.session() is session
+
+    assert session.closed
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_client_caches_claim_checks():
+    port=8091
+    vasp_address, vasp_subaddress, originator_claim, beneficiary_claim = fixture_example_claim(port)
+
+    cdb = ClaimsDB(vasp_address)
+    runner = await run_service(cdb, port=port)
+
+    claim = cdb.add_own_claim(originator_claim)
+
+    async with DynClient() as client:
+        statuses = await asyncio.gather(*[client.check_other_claim(claim) for _ in range(5)])
+        assert statuses == [Status.correct_record] * 5
+        assert await client.check_other_claim(claim) == Status.correct_record
+
+        stats = client.check_cache.stats()
+        assert stats['misses'] == 1
+        assert stats['coalesced'] == 4
+        assert stats['hits'] == 1
+
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_run_service_metrics():
+    port=8092
+    vasp_address, vasp_subaddress, originator_claim, beneficiary_claim = fixture_example_claim(port)
+
+    cdb = ClaimsDB(vasp_address)
+    runner = await run_service(cdb, port=port)
+
+    claim = cdb.add_own_claim(originator_claim)
+
+    async with DynClient() as client:
+        assert await client.check_other_claim(claim) == Status.correct_record
+        url = f'http://localhost:{port}'
+        status, _ = await client.get_subaddress_from_subaddress(url, vasp_subaddress)
+        assert status == Status.fresh_dynamic_subaddress
+
+        async with client.session().get(url + '/metrics') as resp:
+            assert resp.status == 200
+            text = await resp.text()
+
+    assert 'dyn_http_requests_total{code="200",method="POST",route="/check"} 1' in text
+    assert 'dyn_http_responses_total{route="/generate",status="fresh_dynamic_subaddress"} 1' in text
+    assert 'dyn_http_request_duration_seconds_count{route="/check"} 1' in text
+    assert 'dyn_claims_db_duration_seconds_count{operation="check_own_claim"} 1' in text
+
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_run_service_check_batch():
+    port=8093
+    vasp_address, vasp_subaddress, originator_claim, beneficiary_claim = fixture_example_claim(port)
+
+    cdb = ClaimsDB(vasp_address)
+    runner = await run_service(cdb, port=port)
+
+    claim = cdb.add_own_claim(originator_claim)
+    incorrect_claim = dict(claim, legal_name='Eve')
+    other_vasp_claim = dict(claim, vasp_libra_address=LibraAddress.from_bytes(urandom(16)).as_str())
+
+    first_result = asyncio.Event()
+
+    async def claims():
+        yield claim
+        # Results stream back before the request body is complete
+        await asyncio.wait_for(first_result.wait(), 5)
+        for i in range(9):
+            yield claim
+        yield incorrect_claim
+        yield other_vasp_claim
+        yield claim
+
+    async def checker(libra_address, url):
+        return libra_address == vasp_address
+
+    async with DynClient(custom_checker=checker) as client:
+        url = f'http://localhost:{port}'
+        statuses = []
+        async for status in client.check_other_claims(url, claims()):
+            statuses.append(status)
+            first_result.set()
+
+    assert statuses == [Status.correct_record] * 10 + [
+        Status.incorrect_record, Status.incorrect_address, Status.correct_record]
+
+    await runner.cleanup()
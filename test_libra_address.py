@@ -0,0 +1,52 @@
+from os import urandom
+
+import pytest
+from libra_address import LibraAddress, LibraAddressError, LibraAddressTemplate
+
+
+def test_from_encoded_str_is_cached():
+    address = LibraAddress.from_bytes(urandom(16), urandom(8))
+    before = LibraAddress.cache_info()
+
+    first = LibraAddress.from_encoded_str(address.as_str())
+    second = LibraAddress.from_encoded_str(address.as_str())
+    assert first is second
+    assert first == address
+
+    after = LibraAddress.cache_info()
+    assert after.misses == before.misses + 1
+    assert after.hits == before.hits + 1
+
+    with pytest.raises(LibraAddressError):
+        LibraAddress.from_encoded_str(address.as_str()[:-1])
+
+
+def test_address_is_immutable():
+    address = LibraAddress.from_bytes(urandom(16), urandom(8))
+    with pytest.raises(AttributeError):
+        address.hrp = 'tlb'
+    assert not hasattr(address, '__dict__')
+
+
+def test_get_onchain_is_memoized():
+    address = LibraAddress.from_bytes(urandom(16), urandom(8))
+    onchain = address.get_onchain()
+    assert onchain is address.get_onchain()
+    assert onchain.subaddress_bytes is None
+    assert onchain.onchain_address_bytes == address.onchain_address_bytes
+    assert onchain.get_onchain() is onchain
+
+
+def test_template_matches_from_bytes():
+    onchain_bytes = urandom(16)
+    template = LibraAddressTemplate.from_encoded_str(LibraAddress.from_bytes(onchain_bytes, urandom(8)).as_str())
+
+    subaddresses = [urandom(8) for _ in range(10)]
+    expected = [LibraAddress.from_bytes(onchain_bytes, sub).as_str() for sub in subaddresses]
+    assert template.encode_many(subaddresses) == expected
+    assert template.encode(subaddresses[0]) == expected[0]
+    assert template.from_subaddress_bytes(subaddresses[0]) == LibraAddress.from_encoded_str(expected[0])
+    assert template.from_subaddress_bytes(None) == LibraAddress.from_bytes(onchain_bytes)
+
+    with pytest.raises(LibraAddressError):
+        template.encode(b'short')
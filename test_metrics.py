@@ -0,0 +1,55 @@
+import pytest
+from metrics import LatencyRecorder, MetricsRegistry, timed
+
+
+def test_latency_recorder_summary():
+    recorder = LatencyRecorder(samples=100)
+    for i in range(1, 201):
+        recorder.record('step', i / 1000)
+    summary = recorder.summary()['step']
+    assert summary['count'] == 200
+    assert summary['max'] == 0.2
+    assert summary['p50'] == 0.151
+    assert summary['p95'] == 0.196
+
+
+def test_metrics_registry_render():
+    metrics = MetricsRegistry(buckets=(0.25, 1.0))
+    metrics.inc('dyn_http_requests_total', route='/check', code=200)
+    metrics.inc('dyn_http_requests_total', route='/check', code=200)
+    metrics.observe('dyn_http_request_duration_seconds', 0.125, route='/check')
+    metrics.observe('dyn_http_request_duration_seconds', 0.5, route='/check')
+    metrics.observe('dyn_http_request_duration_seconds', 2.0, route='/check')
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE dyn_http_requests_total counter' in lines
+    assert 'dyn_http_requests_total{code="200",route="/check"} 2' in lines
+    assert '# TYPE dyn_http_request_duration_seconds histogram' in lines
+    assert 'dyn_http_request_duration_seconds_bucket{route="/check",le="0.25"} 1' in lines
+    assert 'dyn_http_request_duration_seconds_bucket{route="/check",le="1.0"} 2' in lines
+    assert 'dyn_http_request_duration_seconds_bucket{route="/check",le="+Inf"} 3' in lines
+    assert 'dyn_http_request_duration_seconds_sum{route="/check"} 2.625' in lines
+    assert 'dyn_http_request_duration_seconds_count{route="/check"} 3' in lines
+
+
+def test_metrics_registry_escapes_labels():
+    metrics = MetricsRegistry()
+    metrics.inc('requests', route='a"b\\c\n')
+    assert 'requests{route="a\\"b\\\\c\\n"} 1' in metrics.render()
+
+
+class Timed:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @timed('operation_seconds', 'work')
+    async def work(self, value):
+        return value * 2
+
+
+@pytest.mark.asyncio
+async def test_timed_records_when_enabled():
+    metrics = MetricsRegistry()
+    assert await Timed(metrics).work(2) == 4
+    assert 'operation_seconds_count{operation="work"} 1' in metrics.render()
+    assert await Timed(None).work(3) == 6
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+from benchmarks import microbench
+
+BASELINES = microbench.load_baselines()
+THRESHOLD = float(os.environ.get('DYN_BENCH_THRESHOLD', BASELINES.get('threshold', microbench.DEFAULT_THRESHOLD)))
+
+
+@pytest.mark.parametrize('name', list(microbench.cases()))
+def test_no_regression(name):
+    case = microbench.cases()[name]
+    if case is None:
+        pytest.skip('needs the libra SDK')
+    baseline = BASELINES['cases'].get(name)
+    if baseline is None:
+        pytest.skip('no baseline, see benchmarks/microbench.py --update-baselines')
+
+    # Measure again before failing, in case the machine was busy
+    ratios = []
+    for _ in range(3):
+        ratios.append(microbench.score(case) / baseline)
+        if ratios[-1] <= THRESHOLD:
+            break
+    assert min(ratios) <= THRESHOLD, f'{name} is {min(ratios):.2f}x its baseline'
+
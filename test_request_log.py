@@ -0,0 +1,77 @@
+import asyncio
+import io
+import json
+import threading
+import time
+
+import pytest
+from request_log import RequestLogger
+
+
+@pytest.mark.asyncio
+async def test_request_log_writes_compact_records():
+    stream = io.StringIO()
+    request_log = RequestLogger(stream=stream, max_payload=30)
+    request_log.start()
+    request_log.log('/check', {'legal_name': 'Adam Smith'}, {'status': 'success'})
+    request_log.log('/check', {'legal_name': 'A' * 100}, {'status': 'success'})
+    await asyncio.sleep(0.05)
+    await request_log.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    first, second = [json.loads(line) for line in lines]
+    assert first['route'] == '/check'
+    assert first['request'] == {'legal_name': 'Adam Smith'}
+    assert first['response'] == {'status': 'success'}
+    assert second['request'] == '{"legal_name":"' + 'A' * 15 + '...'
+    assert request_log.stats()['logged'] == 2
+
+
+@pytest.mark.asyncio
+async def test_request_log_samples_but_keeps_errors():
+    stream = io.StringIO()
+    request_log = RequestLogger(stream=stream, sample_rate=0.0)
+    for _ in range(100):
+        request_log.log('/generate', {}, {'status': 'success'})
+    request_log.log('/generate', {}, {'status': 'unexpected_error'}, error='Traceback')
+    await request_log.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record['error'] for record in records] == ['Traceback']
+
+
+@pytest.mark.asyncio
+async def test_request_log_drops_when_full():
+    request_log = RequestLogger(stream=io.StringIO(), queue_size=2)
+    for _ in range(5):
+        request_log.log('/check', {}, {})
+    assert request_log.stats()['dropped'] == 3
+    await request_log.stop()
+    assert request_log.stats()['logged'] == 2
+
+
+class SlowStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Lock()
+
+    def write(self, data):
+        assert self.writing.acquire(blocking=False), 'concurrent writes'
+        time.sleep(0.05)
+        self.writing.release()
+        return super().write(data)
+
+
+@pytest.mark.asyncio
+async def test_request_log_stop_waits_for_write_in_progress():
+    stream = SlowStream()
+    request_log = RequestLogger(stream=stream)
+    request_log.log('/check', {'number': 0}, {})
+    await asyncio.sleep(0.01)
+    for number in range(1, 4):
+        request_log.log('/check', {'number': number}, {})
+    await request_log.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record['request']['number'] for record in records] == [0, 1, 2, 3]
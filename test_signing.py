@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+from signing import SigningService
+
+
+class SlowKey:
+    def sign_dual_attestation_data(self, reference_id, libra_address_bytes, amount):
+        time.sleep(0.001)
+        return f'{reference_id}:{amount}'.encode('utf-8')
+
+    def verify_dual_attestation_data(self, reference_id, libra_address_bytes, amount, signature):
+        if signature != f'{reference_id}:{amount}'.encode('utf-8'):
+            raise ValueError('Invalid Signature')
+
+
+@pytest.mark.asyncio
+async def test_signing_service_batches_requests():
+    service = SigningService(SlowKey(), max_workers=2, max_batch=8)
+    signatures = await asyncio.gather(*[
+        service.sign_dual_attestation_data(f'ref{i}', b'\0' * 16, i) for i in range(40)
+    ])
+    assert signatures == [f'ref{i}:{i}'.encode('utf-8') for i in range(40)]
+
+    stats = service.stats()
+    assert stats['requests'] == 40
+    assert stats['batches'] < 40
+    assert stats['queue_depth'] == 0
+    assert stats['latencies']['total']['count'] == 40
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_signing_service_returns_errors_per_request():
+    service = SigningService(SlowKey())
+    results = await asyncio.gather(
+        service.verify_dual_attestation_data('ref', b'\0' * 16, 1, b'ref:1'),
+        service.verify_dual_attestation_data('ref', b'\0' * 16, 1, b'wrong'),
+        return_exceptions=True,
+    )
+    assert results[0] is None
+    assert isinstance(results[1], ValueError)
+    await service.stop()
@@ -0,0 +1,120 @@
+from os import urandom
+
+import pytest
+from backend import ClaimsDB, Status
+from example_claims import example_claim
+from libra_address import LibraAddress
+from storage import MemoryStorage, SQLiteStorage
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_persists_claims(tmp_path):
+    path = str(tmp_path / 'claims.sqlite')
+    vasp_bytes = urandom(16)
+    vasp_address = LibraAddress.from_bytes(vasp_bytes).as_str()
+
+    storage = SQLiteStorage(path, commit_batch=2)
+    cdb = ClaimsDB(vasp_address, storage=storage)
+    claim = cdb.add_own_claim(example_claim(vasp_bytes))
+    _, dynamic_subaddress = await cdb.generate_dynamic_subaddress(claim)
+    storage.close()
+
+    # A new ClaimsDB on the same file sees all previous records
+    storage = SQLiteStorage(path)
+    cdb = ClaimsDB(vasp_address, storage=storage)
+    assert await cdb.check_own_claim(claim) == Status.correct_record
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) == claim
+    assert await cdb.check_own_dynamic_subaddress(claim['long_term_subaddress']) == claim
+    assert len(cdb.dyn_DB) == 2
+    storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_table_behaves_like_dict(tmp_path):
+    sqlite = SQLiteStorage(str(tmp_path / 'claims.sqlite'))
+    memory = MemoryStorage()
+
+    for storage in [sqlite, memory]:
+        table = storage.reference_id_DB
+        table[('ref', 'sig')] = ({'a': 1}, {'b': 2}, 10)
+        table.update([(('ref2', 'sig2'), ({}, {}, 5))])
+        assert ('ref', 'sig') in table
+        assert table[('ref', 'sig')] == ({'a': 1}, {'b': 2}, 10)
+        assert table.get(('missing', 'sig')) is None
+        assert sorted(table) == [('ref', 'sig'), ('ref2', 'sig2')]
+        del table[('ref2', 'sig2')]
+        assert len(table) == 1
+        with pytest.raises(KeyError):
+            del table[('ref2', 'sig2')]
+    sqlite.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_persists_expiries(tmp_path):
+    path = str(tmp_path / 'claims.sqlite')
+    vasp_bytes = urandom(16)
+    vasp_address = LibraAddress.from_bytes(vasp_bytes).as_str()
+    now = [1000.0]
+
+    storage = SQLiteStorage(path)
+    cdb = ClaimsDB(vasp_address, storage=storage, subaddress_ttl=60, clock=lambda: now[0])
+    claim = cdb.add_own_claim(example_claim(vasp_bytes))
+    _, dynamic_subaddress = await cdb.generate_dynamic_subaddress(claim)
+    storage.close()
+
+    # The expiry times are reloaded when a new ClaimsDB starts
+    storage = SQLiteStorage(path)
+    cdb = ClaimsDB(vasp_address, storage=storage, subaddress_ttl=60, clock=lambda: now[0])
+    await cdb.start()
+    assert len(cdb.subaddress_expiries) == 1
+    now[0] += 61
+    assert await cdb.purge_expired() == 1
+    assert await cdb.check_own_dynamic_subaddress(dynamic_subaddress) is None
+    assert len(cdb.dyn_DB) == 1
+    await cdb.stop()
+    storage.close()
+
+
+def test_sqlite_transaction_rolls_back(tmp_path):
+    path = str(tmp_path / 'claims.sqlite')
+    storage = SQLiteStorage(path, commit_batch=1)
+    other = SQLiteStorage(path, commit_batch=1)
+
+    with storage.transaction():
+        storage.claim_index_DB[0] = 'claim-0'
+        # Not visible to other connections before the transaction commits
+        assert 0 not in other.claim_index_DB
+    assert other.claim_index_DB[0] == 'claim-0'
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.claim_index_DB[1] = 'claim-1'
+            raise RuntimeError()
+    assert 1 not in storage.claim_index_DB
+    assert 1 not in other.claim_index_DB
+    storage.close()
+    other.close()
+
+
+def test_sqlite_transaction_joins_the_pending_batch(tmp_path):
+    path = str(tmp_path / 'claims.sqlite')
+    storage = SQLiteStorage(path, commit_batch=10)
+    other = SQLiteStorage(path)
+
+    storage.claim_index_DB[0] = 'claim-0'
+    with storage.transaction():
+        storage.claim_index_DB[1] = 'claim-1'
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.claim_index_DB[2] = 'claim-2'
+            raise RuntimeError()
+    # Only the failed block is rolled back, and nothing is committed yet
+    assert storage.claim_index_DB.get(0) == 'claim-0'
+    assert storage.claim_index_DB.get(1) == 'claim-1'
+    assert 2 not in storage.claim_index_DB
+    assert len(other.claim_index_DB) == 0
+
+    storage.flush()
+    assert len(other.claim_index_DB) == 2
+    storage.close()
+    other.close()
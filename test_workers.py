@@ -0,0 +1,60 @@
+import asyncio
+import functools
+from os import urandom
+
+import pytest
+from backend import Status
+from example_claims import example_claim
+from client import DynClient
+from libra_address import LibraAddress
+from workers import WorkerPool, shared_claims_db
+
+
+@pytest.mark.asyncio
+async def test_workers_share_claims(tmp_path):
+    port = 8094
+    path = str(tmp_path / 'claims.sqlite')
+    vasp_bytes = urandom(16)
+    vasp_address = LibraAddress.from_bytes(vasp_bytes).as_str()
+    subaddress_key = urandom(32)
+
+    cdb = shared_claims_db(vasp_address, path, subaddress_key=subaddress_key)
+    claims = [cdb.add_own_claim(example_claim(vasp_bytes, port)) for _ in range(8)]
+
+    pool = WorkerPool(
+        functools.partial(shared_claims_db, vasp_address, path, subaddress_key=subaddress_key),
+        address='localhost', port=port, workers=3, heartbeat_interval=0.1, log_sample_rate=0)
+    pool.start()
+    try:
+        assert pool.wait_ready()
+
+        # Workers allocate claim indexes concurrently, without conflicts
+        url = f'http://localhost:{port}'
+        async with DynClient() as client:
+            results = await asyncio.gather(*[
+                client.get_subaddresses_from_subaddress(url, claim['long_term_subaddress'], 5)
+                for claim in claims for _ in range(3)
+            ])
+            assert all(status == Status.fresh_dynamic_subaddress for status, _ in results)
+            subaddresses = [subaddress for _, batch in results for subaddress in batch]
+            assert len(set(subaddresses)) == len(subaddresses)
+
+            # Any worker resolves the subaddresses issued by the others
+            for claim in claims:
+                assert await client.check_other_claim(claim) == Status.correct_record
+            for subaddress in subaddresses[::7]:
+                status, _ = await client.get_subaddress_from_subaddress(url, subaddress)
+                assert status == Status.fresh_dynamic_subaddress
+
+        assert sorted(cdb.claim_index_DB) == list(range(len(claims)))
+        assert sorted(cdb.claim_index_DB.values()) == sorted(claim['unique_identifier'] for claim in claims)
+
+        await asyncio.sleep(0.3)
+        health = pool.health()
+        assert [worker['healthy'] for worker in health] == [True] * 3
+        assert sum(worker['requests'] for worker in health) >= len(claims) * 4
+    finally:
+        pool.stop()
+        cdb.storage.close()
+
+    assert [worker['exitcode'] for worker in pool.health()] == [0] * 3
@@ -0,0 +1,169 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import traceback
+
+from backend import ClaimsDB
+from metrics import MetricsRegistry
+from service import run_service
+from storage import SQLiteStorage
+
+
+def shared_claims_db(own_VASP_address, path, **claims_db_kwargs):
+    """ Create a ClaimsDB on an SQLite file shared with other processes, which
+    commits every write so that the other processes see it at once. """
+    return ClaimsDB(own_VASP_address, storage=SQLiteStorage(path, commit_batch=1), **claims_db_kwargs)
+
+
+class WorkerPool:
+    """ Serves a ClaimsDB from several processes, all bound to the same port
+    with SO_REUSEPORT, so that the kernel spreads connections among them.
+
+    Each worker process calls `make_claims_db()` to create its own ClaimsDB,
+    so the ClaimsDBs should share their records through a common storage
+    (see `shared_claims_db`). With the multiprocessing start methods other
+    than fork, `make_claims_db` must be picklable, e.g. a module level
+    function or a functools.partial of one.
+
+    Workers report a heartbeat with their request count every
+    `heartbeat_interval` seconds, see `health`. On `stop`, workers stop
+    accepting connections, finish the requests in progress and flush their
+    storage before they exit.
+    """
+
+    def __init__(self, make_claims_db, address='0.0.0.0', port=8080, workers=None,
+                 heartbeat_interval=1.0, **service_kwargs):
+        self.make_claims_db = make_claims_db
+        self.address = address
+        self.port = port
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.heartbeat_interval = heartbeat_interval
+        self.service_kwargs = service_kwargs
+
+        self._context = multiprocessing.get_context()
+        self._heartbeats = self._context.Queue()
+        self._processes = []
+        self._last_heartbeats = {}
+
+    def start(self):
+        """ Start the worker processes. """
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, self.make_claims_db, self.address, self.port, self.service_kwargs,
+                      self._heartbeats, self.heartbeat_interval),
+                name=f'dyn-worker-{index}',
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout=10):
+        """ Ask the workers to shut down gracefully, and kill those that have
+        not exited after timeout seconds. """
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def wait_ready(self, timeout=10):
+        """ Wait until every worker has reported a heartbeat, returns whether
+        they all have. """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            health = self.health()
+            if all(worker['last_heartbeat'] is not None for worker in health):
+                return True
+            if any(not worker['alive'] for worker in health):
+                return False
+            time.sleep(0.05)
+        return False
+
+    def health(self):
+        """ Return, for each worker, its pid, whether it is alive and healthy
+        (it sent a heartbeat recently), its exit code, the time of its last
+        heartbeat and the number of requests it has handled. """
+        while True:
+            try:
+                index, heartbeat = self._heartbeats.get_nowait()
+            except queue.Empty:
+                break
+            self._last_heartbeats[index] = heartbeat
+
+        now = time.time()
+        health = []
+        for index, process in enumerate(self._processes):
+            heartbeat = self._last_heartbeats.get(index)
+            alive = process.is_alive()
+            health.append({
+                'worker': index,
+                'pid': process.pid,
+                'alive': alive,
+                'healthy': alive and heartbeat is not None
+                and now - heartbeat['time'] < 3 * self.heartbeat_interval,
+                'exitcode': process.exitcode,
+                'last_heartbeat': heartbeat['time'] if heartbeat is not None else None,
+                'requests': heartbeat['requests'] if heartbeat is not None else 0,
+            })
+        return health
+
+    def run_forever(self):
+        """ Start the workers, and stop them on SIGINT or SIGTERM. """
+        stopping = []
+        previous = {
+            sig: signal.signal(sig, lambda signum, frame: stopping.append(signum))
+            for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            self.start()
+            while not stopping:
+                time.sleep(self.heartbeat_interval)
+                for worker in self.health():
+                    if not worker['alive']:
+                        print(f'Worker {worker["worker"]} exited with code {worker["exitcode"]}')
+        finally:
+            self.stop()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+
+def _worker_main(index, make_claims_db, address, port, service_kwargs, heartbeats, heartbeat_interval):
+    try:
+        asyncio.run(_serve(index, make_claims_db, address, port, service_kwargs, heartbeats, heartbeat_interval))
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
+
+
+async def _serve(index, make_claims_db, address, port, service_kwargs, heartbeats, heartbeat_interval):
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    claims_db = make_claims_db()
+    metrics = service_kwargs.pop('metrics', None) or MetricsRegistry()
+    runner = await run_service(claims_db, address, port, metrics=metrics, reuse_port=True, **service_kwargs)
+    try:
+        while not stopping.is_set():
+            heartbeats.put((index, {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'requests': metrics.total('dyn_http_requests_total'),
+            }))
+            try:
+                await asyncio.wait_for(stopping.wait(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Stops the ClaimsDB, which flushes its storage
+        await runner.cleanup()
+        claims_db.storage.close()